@@ -0,0 +1,120 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+from .database import dialect_insert
+from .models import JobApplication, JobStatus, JobStatusRollup, JobWeekRollup, User
+
+# Number of weeks shown in the weekly activity chart
+WEEKS = 12
+
+def week_of(value):
+    """Monday of the week a datetime falls in."""
+    return (value - timedelta(days=value.weekday())).date()
+
+class RollupDelta:
+    """Pending changes to a user's rollup rows, applied in the same transaction as the job writes."""
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.weeks = Counter()
+
+    def add(self, status, date_applied, n=1):
+        if status is not None:
+            self.statuses[JobStatus(status).value] += n
+        if date_applied is not None:
+            self.weeks[week_of(date_applied)] += n
+
+    def remove(self, status, date_applied):
+        self.add(status, date_applied, n=-1)
+
+def apply_rollup(db: Session, user_id: int, delta: RollupDelta):
+    """Add a delta to the user's rollup rows. Does not commit."""
+    insert = dialect_insert(db)
+    for model, key, counts in (
+        (JobStatusRollup, "status", delta.statuses),
+        (JobWeekRollup, "week_start", delta.weeks),
+    ):
+        rows = [{"user_id": user_id, key: k, "count": n} for k, n in counts.items() if n]
+        if not rows:
+            continue
+        stmt = insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", key],
+            set_={"count": model.count + stmt.excluded.count},
+        )
+        db.execute(stmt)
+
+def record_job_changes(db: Session, user_id: int, delta: RollupDelta):
+    """
+    Called by every write to a user's job applications, in the same transaction.
+    Applies the rollup delta and bumps the user's jobs_version (used for ETags).
+    """
+    apply_rollup(db, user_id, delta)
+    db.query(User).filter(User.id == user_id).update(
+        {User.jobs_version: func.coalesce(User.jobs_version, 0) + 1}, synchronize_session=False
+    )
+
+def _week_start(db: Session, column):
+    # Monday of the column's week, as a "YYYY-MM-DD" string.
+    # Literals rather than bound params, so GROUP BY matches the selected expression
+    if db.bind.dialect.name == "postgresql":
+        return func.to_char(func.date_trunc(literal_column("'week'"), column), literal_column("'YYYY-MM-DD'"))
+    # SQLite: forward to Sunday, then back to that week's Monday
+    return func.date(column, literal_column("'weekday 0'"), literal_column("'-6 days'"))
+
+def rebuild_rollup(db: Session, user_id: int):
+    """Recompute a user's rollup rows from job_applications. Does not commit."""
+    db.query(JobStatusRollup).filter(JobStatusRollup.user_id == user_id).delete(synchronize_session=False)
+    db.query(JobWeekRollup).filter(JobWeekRollup.user_id == user_id).delete(synchronize_session=False)
+
+    status_counts = db.query(JobApplication.status, func.count(JobApplication.id)).filter(
+        JobApplication.user_id == user_id,
+        JobApplication.status.isnot(None)
+    ).group_by(JobApplication.status).all()
+    db.add_all(JobStatusRollup(user_id=user_id, status=JobStatus(status).value, count=count) for status, count in status_counts)
+
+    week = _week_start(db, JobApplication.date_applied)
+    week_counts = db.query(week, func.count(JobApplication.id)).filter(
+        JobApplication.user_id == user_id,
+        JobApplication.date_applied.isnot(None)
+    ).group_by(week).all()
+    db.add_all(JobWeekRollup(user_id=user_id, week_start=date.fromisoformat(key), count=count) for key, count in week_counts)
+    db.flush()
+
+def compute_stats(db: Session, user_id: int, weeks: int = WEEKS, today: datetime = None):
+    """Summary counts, status funnel and weekly activity for one user, read from the rollup tables."""
+    funnel_counts = {s.value: 0 for s in JobStatus}
+    for status, count in db.query(JobStatusRollup.status, JobStatusRollup.count).filter(JobStatusRollup.user_id == user_id):
+        if status in funnel_counts:
+            funnel_counts[status] = count
+    total = sum(funnel_counts.values())
+
+    # Weekly Activity over the last `weeks` weeks, one row per week at most
+    first_monday = week_of(today or datetime.now()) - timedelta(weeks=weeks - 1)
+    weekly_map = {(first_monday + timedelta(weeks=i)).isoformat(): 0 for i in range(weeks)}
+    for week_start, count in db.query(JobWeekRollup.week_start, JobWeekRollup.count).filter(
+        JobWeekRollup.user_id == user_id,
+        JobWeekRollup.week_start >= first_monday
+    ):
+        key = week_start.isoformat()
+        if key in weekly_map:
+            weekly_map[key] = count
+
+    return _format_stats(total, funnel_counts, weekly_map)
+
+def _format_stats(total, funnel_counts, weekly_map):
+    # Active usually means "In Progress" (Applied + Interviewing)
+    active = funnel_counts["APPLIED"] + funnel_counts["INTERVIEWING"]
+    # Response Rate: any status except "APPLIED" counts as a response
+    responded = sum(count for s, count in funnel_counts.items() if s != "APPLIED")
+    return {
+        "summary": {
+            "total": total,
+            "active": active,
+            "offers": funnel_counts["OFFER"],
+            "response_rate": f"{(responded / total * 100):.1f}%" if total > 0 else "0%"
+        },
+        "funnel_counts": funnel_counts,
+        "weekly_activity": [{"week": k, "count": v} for k, v in sorted(weekly_map.items())]
+    }
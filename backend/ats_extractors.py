@@ -0,0 +1,153 @@
+import re
+from collections import Counter
+from .email_preprocessor import clean_body
+from .ignore_rules import domain_matches, split_sender
+
+# Deterministic parsers for the fixed templates of common applicant tracking
+# systems. A match gives the same company_name/job_title/status/notes dict as
+# Gemini, so those emails never need an LLM call. Extractors only answer when
+# they find all three of company, title and status; otherwise the LLM decides.
+
+# Placeholders usable in template patterns
+COMPANY = r"(?P<company>[^\n.,!?:|()]{2,60}?)"
+TITLE = r"(?P<title>[^\n.,!?:|]{2,80}?)"
+END = r"\s*(?:[.!,;:\n]|$)"
+
+# First match wins, so rejections are checked before the "thank you for your interest" they often open with
+STATUS_RULES = [
+    ("OFFER", re.compile(r"\b(pleased to (extend|offer)|offer letter|excited to offer you)\b", re.IGNORECASE)),
+    ("REJECTED", re.compile(
+        r"\b(unfortunately|regret to inform|not (to )?(move|moving) forward|decided to (pursue|move forward with) other"
+        r"|(have|has) not been selected|will not be (moving|proceeding)|position has been filled)\b", re.IGNORECASE)),
+    ("INTERVIEWING", re.compile(
+        r"\b(schedule (an? |your )?(interview|call|phone screen|time to (chat|talk))|invite you to (an? )?interview"
+        r"|interview (invitation|request)|like to (set up|arrange) (an? )?(interview|call))\b", re.IGNORECASE)),
+    ("APPLIED", re.compile(
+        r"\b(thanks? (you )?for (applying|your application|submitting your application)|received your application"
+        r"|application (has been |was )?(received|submitted)|successfully applied)\b", re.IGNORECASE)),
+]
+
+NOTES = {
+    "APPLIED": "Application received",
+    "INTERVIEWING": "Interview requested",
+    "REJECTED": "Rejected",
+    "OFFER": "Offer received",
+}
+
+# Not company or role names, even when the template position says so
+GENERIC_NAMES = {"us", "our team", "the team", "our company", "the company", "the position", "the role", "this position", "this role"}
+
+# Phrasings shared by most ATS templates
+COMMON_SUBJECTS = [
+    rf"^(?:thank you|thanks) for (?:applying|your application|your interest) (?:to|at|in|with) {COMPANY}{END}",
+    rf"^your application (?:to|at|with) {COMPANY}{END}",
+    rf"^{COMPANY}\s*[-–|:]\s*(?:application (?:received|update|status)|thank you for applying){END}",
+]
+COMMON_BODIES = [
+    rf"\b(?:applying|applied|application|interest) (?:for|in|to) (?:the |our )?(?:position of )?{TITLE}"
+    rf"(?: (?:role|position|job|opening))?(?: \([^)]*\))? (?:at|with) {COMPANY}{END}",
+]
+
+def _clean(value):
+    value = re.sub(r"\s+", " ", value or "").strip(" \"'“”‘’-–")
+    return None if not value or value.lower() in GENERIC_NAMES else value
+
+def status_of(text):
+    for status, pattern in STATUS_RULES:
+        if pattern.search(text):
+            return status
+    return None
+
+class TemplateExtractor:
+    """Subject and body patterns for the emails sent from one ATS's domains."""
+
+    def __init__(self, name, domains, subjects=(), bodies=()):
+        self.name = name
+        self.domains = set(domains)
+        self.subjects = [re.compile(p, re.IGNORECASE) for p in [*subjects, *COMMON_SUBJECTS]]
+        self.bodies = [re.compile(p, re.IGNORECASE) for p in [*bodies, *COMMON_BODIES]]
+
+    def handles(self, domain):
+        # The domain itself or any parent domain (e.g. us.greenhouse-mail.io)
+        return domain_matches(domain, self.domains)
+
+    def extract(self, msg):
+        subject = (msg.get("subject") or "").strip()
+        body = clean_body(msg.get("body"))
+        fields = {}
+        for patterns, text in ((self.subjects, subject), (self.bodies, body)):
+            for pattern in patterns:
+                match = pattern.search(text)
+                if not match:
+                    continue
+                for key, value in match.groupdict().items():
+                    if key not in fields and _clean(value):
+                        fields[key] = _clean(value)
+
+        status = status_of(f"{subject}\n{body}")
+        if not (fields.get("company") and fields.get("title") and status):
+            return None
+        return {
+            "company_name": fields["company"],
+            "job_title": fields["title"],
+            "status": status,
+            "notes": NOTES[status],
+        }
+
+EXTRACTORS = []
+# Per extractor: emails it was tried on and emails it answered
+COUNTERS = {}
+
+def register(extractor):
+    """
+    Add an extractor to the registry. Earlier registrations are tried first.
+    An extractor has a `name`, `handles(domain)` to pick emails by sender
+    domain, and `extract(msg)` returning the parsed dict or None.
+    """
+    EXTRACTORS.append(extractor)
+    COUNTERS[extractor.name] = Counter()
+    return extractor
+
+def extract(msg):
+    """Parse an email with the first registered extractor that handles its sender and matches, or return None."""
+    _, domain = split_sender(msg.get("sender"))
+    if not domain:
+        return None
+    for extractor in EXTRACTORS:
+        if not extractor.handles(domain):
+            continue
+        COUNTERS[extractor.name]["tried"] += 1
+        result = extractor.extract(msg)
+        if result:
+            COUNTERS[extractor.name]["hits"] += 1
+            return result
+    return None
+
+def hit_rates():
+    """Tries, hits and hit rate of each extractor since the process started."""
+    return {
+        name: {"tried": c["tried"], "hits": c["hits"], "hit_rate": round(c["hits"] / c["tried"], 3) if c["tried"] else 0.0}
+        for name, c in COUNTERS.items()
+    }
+
+register(TemplateExtractor(
+    "greenhouse", {"greenhouse.io", "greenhouse-mail.io"},
+    bodies=[rf"\byour application for (?:the )?{TITLE} (?:role|position) at {COMPANY}{END}"],
+))
+register(TemplateExtractor(
+    "lever", {"lever.co", "hire.lever.co"},
+    subjects=[rf"^{COMPANY} application update[:\s-]+{TITLE}{END}"],
+))
+register(TemplateExtractor(
+    "workday", {"myworkday.com", "myworkdayjobs.com"},
+    subjects=[rf"^{COMPANY}[:\s-]+(?:application received|thank you for applying)[:\s-]+(?:\w*\d\w*\s+)?{TITLE}$"],
+))
+register(TemplateExtractor(
+    "ashby", {"ashbyhq.com"},
+    bodies=[rf"\bthe {TITLE} role at {COMPANY}{END}"],
+))
+register(TemplateExtractor(
+    "smartrecruiters", {"smartrecruiters.com", "smartrecruitersmail.com"},
+    subjects=[rf"^(?:thank you for )?your application(?: for|:)\s+{TITLE} at {COMPANY}{END}",
+              rf"^(?:thank you for )?your application(?: for|:)\s+{TITLE}$"],
+))
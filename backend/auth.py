@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Header
 from fastapi.responses import JSONResponse, RedirectResponse
-from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 import os
 import httpx
-from .database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
 from .models import User
+from .token_cache import get_cached_user, cache_token, invalidate_token
+from .gmail_async import get_profile
 
 load_dotenv()
 
@@ -41,7 +44,7 @@ async def login():
     return RedirectResponse(url=auth_url)
 
 @router.get("/callback")
-async def login_callback(code: str, db: Session = Depends(get_db)):
+async def login_callback(code: str, db: AsyncSession = Depends(get_async_db)):
     # Exchange code for token
     token_url = "https://oauth2.googleapis.com/token"
     # Determine Redirect URI dynamically (MUST MATCH login)
@@ -79,7 +82,7 @@ async def login_callback(code: str, db: Session = Depends(get_db)):
     email = user_info.get("email")
     
     # Check if user exists, else create/update
-    db_user = db.query(User).filter(User.email == email).first()
+    db_user = await db.scalar(select(User).where(User.email == email))
     if not db_user:
         db_user = User(
             email=email,
@@ -101,44 +104,47 @@ async def login_callback(code: str, db: Session = Depends(get_db)):
     # Let's add access_token column to User model in a bit. For now:
     # PASS TOKEN TO FRONTEND VIA URL (Quick & Dirty for prototype)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     # Returning access token in URL so frontend can send it back for scanning
     FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
     return RedirectResponse(url=f"{FRONTEND_URL}?token={access_token}&email={email}")
 
 @router.get("/verify")
-async def verify_token_endpoint(token: str = Header(...)):
-    from .gmail_service import get_gmail_service
+async def verify_token_endpoint(token: str = Header(...), db: AsyncSession = Depends(get_async_db)):
     try:
-        service = get_gmail_service(token)
         # fast check
-        profile = service.users().getProfile(userId='me').execute()
+        profile = await get_profile(token)
         return {"status": "valid", "email": profile.get("emailAddress")}
     except Exception as e:
         print(f"Token verification failed: {e}")
+        await db.run_sync(invalidate_token, token)
         raise HTTPException(status_code=401, detail="Invalid token")
 
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)):
     token = credentials.credentials
-    from .gmail_service import get_gmail_service
+
+    # 0. Recently verified tokens skip the round-trip to Google
+    user = await db.run_sync(get_cached_user, token)
+    if user:
+        return user
     
     try:
         # 1. Verify token with Google (and get email)
-        service = get_gmail_service(token)
-        profile = service.users().getProfile(userId='me').execute()
+        profile = await get_profile(token)
         email = profile.get("emailAddress")
     except Exception as e:
         print(f"Auth failed: {e}")
+        await db.run_sync(invalidate_token, token)
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
     # 2. Get User from DB
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
         # Auto-create user if they exist in Google but not DB (edge case validity?)
         # For now, let's assume they should exist if they logged in.
@@ -146,4 +152,5 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # So they should exist.
         raise HTTPException(status_code=401, detail="User not found")
         
+    await db.run_sync(cache_token, token, user.id)
     return user
@@ -0,0 +1,79 @@
+import hashlib
+import json
+from sqlalchemy.orm import Session
+from .models import ClassificationCache
+from .llm_service import GEMINI_MODEL, PROMPT_VERSION
+
+# Cache of LLM classifications so rescans don't pay for the same email twice.
+# Entries are keyed by user + Gmail message id + hash of the text sent to the
+# model, and only match the current model and prompt version.
+
+def hash_text(email_text):
+    return hashlib.sha256(email_text.encode("utf-8")).hexdigest()
+
+def get_cached_results(db: Session, user_id, emails):
+    """
+    Look up the user's cached classifications for (message_id, email_text) pairs.
+    Returns a dict of message_id -> result (None for cached negatives).
+    """
+    if not emails:
+        return {}
+
+    hashes = {message_id: hash_text(email_text) for message_id, email_text in emails}
+    rows = db.query(ClassificationCache).filter(
+        ClassificationCache.user_id == user_id,
+        ClassificationCache.message_id.in_(list(hashes.keys())),
+        ClassificationCache.model_name == GEMINI_MODEL,
+        ClassificationCache.prompt_version == PROMPT_VERSION
+    ).all()
+
+    cached = {}
+    for row in rows:
+        if hashes.get(row.message_id) == row.body_hash:
+            cached[row.message_id] = json.loads(row.result)
+    return cached
+
+def get_cached_message_ids(db: Session, user_id, message_ids):
+    """
+    Ids that have a cache entry of the user's for the current model and prompt version.
+    Used before the body is downloaded, so the content hash isn't checked yet.
+    """
+    if not message_ids:
+        return set()
+
+    rows = db.query(ClassificationCache.message_id).filter(
+        ClassificationCache.user_id == user_id,
+        ClassificationCache.message_id.in_(list(message_ids)),
+        ClassificationCache.model_name == GEMINI_MODEL,
+        ClassificationCache.prompt_version == PROMPT_VERSION
+    ).all()
+    return {row.message_id for row in rows}
+
+def store_results(db: Session, user_id, entries):
+    """
+    Save the user's (message_id, email_text, result, subject, sender) entries
+    for the current model and prompt version. Older entries for the same
+    messages are replaced.
+    """
+    if not entries:
+        return
+
+    message_ids = [entry[0] for entry in entries]
+    db.query(ClassificationCache).filter(
+        ClassificationCache.user_id == user_id,
+        ClassificationCache.message_id.in_(message_ids)
+    ).delete(synchronize_session=False)
+
+    db.add_all([
+        ClassificationCache(
+            user_id=user_id,
+            message_id=message_id,
+            body_hash=hash_text(email_text),
+            model_name=GEMINI_MODEL,
+            prompt_version=PROMPT_VERSION,
+            result=json.dumps(result),
+            subject=subject,
+            sender=sender
+        )
+        for message_id, email_text, result, subject, sender in entries
+    ])
@@ -0,0 +1,118 @@
+import base64
+import codecs
+import os
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+# Text extraction from Gmail's format=full payloads. Scans only ever send the
+# first few thousand characters to the LLM, so decoding stops at a byte budget
+# instead of decoding every part of a large newsletter in full.
+
+# Max bytes of part data decoded per message (plain text, or HTML when there is none)
+EMAIL_BODY_MAX_BYTES = int(os.getenv("EMAIL_BODY_MAX_BYTES", "32768"))
+
+CHARSET = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+
+def _header(part, name):
+    name = name.lower()
+    for h in part.get('headers') or []:
+        if h.get('name', '').lower() == name:
+            return h.get('value', '')
+    return ''
+
+def _charset(part):
+    match = CHARSET.search(_header(part, 'Content-Type'))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def _is_attachment(part):
+    return bool(part.get('filename')) or _header(part, 'Content-Disposition').lower().startswith('attachment')
+
+def _decode(part, max_bytes):
+    """Decode at most max_bytes of a part's base64url data. Returns (text, bytes used)."""
+    data = (part.get('body') or {}).get('data')
+    if not data or max_bytes <= 0:
+        return '', 0
+    # 4 base64 characters carry 3 bytes, so only the needed prefix is decoded
+    data = data[:(max_bytes + 2) // 3 * 4]
+    raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))[:max_bytes]
+    # A character cut in half at the budget is dropped rather than failing the message
+    return codecs.getincrementaldecoder(_charset(part))(errors='replace').decode(raw), len(raw)
+
+def _text_parts(payload):
+    # Depth-first over the MIME tree, in document order, with an explicit stack
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        mime_type = (part.get('mimeType') or '').lower()
+        if mime_type.startswith('multipart/'):
+            stack.extend(reversed(part.get('parts') or []))
+        elif mime_type in ('text/plain', 'text/html') and not _is_attachment(part):
+            yield mime_type, part
+
+class _HTMLText(HTMLParser):
+    SKIP = {'script', 'style', 'head', 'title'}
+    BREAKS = {'br', 'p', 'div', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'blockquote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag in self.BREAKS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BREAKS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.chunks.append(data)
+
+def html_to_text(html):
+    parser = _HTMLText()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # Broken markup: fall back to dropping the tags
+        return unescape(re.sub(r'<[^>]+>', ' ', html))
+    text = ''.join(parser.chunks)
+    text = re.sub(r'[ \t\r\f\v\xa0]+', ' ', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+def extract_body(payload, max_bytes=None):
+    """
+    Text of a messages.get payload. Inline text/plain parts are joined in
+    order; HTML parts are converted to text only when there is no plain text.
+    Parts are decoded with their declared charset and decoding stops after
+    max_bytes (EMAIL_BODY_MAX_BYTES by default).
+    """
+    budget = EMAIL_BODY_MAX_BYTES if max_bytes is None else max_bytes
+    parts = list(_text_parts(payload or {}))
+
+    for mime_type in ('text/plain', 'text/html'):
+        texts = []
+        remaining = budget
+        for part_type, part in parts:
+            if part_type != mime_type or remaining <= 0:
+                continue
+            text, used = _decode(part, remaining)
+            remaining -= used
+            if text.strip():
+                texts.append(text)
+        if texts:
+            text = '\n\n'.join(texts)
+            return html_to_text(text) if mime_type == 'text/html' else text
+    return ''
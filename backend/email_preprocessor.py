@@ -0,0 +1,141 @@
+import os
+import re
+from collections import Counter
+
+# Shrinks an email before it goes into a Gemini prompt: quoted reply history,
+# signatures, footers and long URLs are removed, and if the rest is still over
+# EMAIL_TEXT_BUDGET characters only the highest-signal sentences are kept.
+
+# Max characters of subject + body sent to the LLM per email
+EMAIL_TEXT_BUDGET = int(os.getenv("EMAIL_TEXT_BUDGET", "4000"))
+# What the scan sent per email before preprocessing, the baseline for chars saved
+UNPROCESSED_TEXT_LIMIT = 8000
+# URLs longer than this are replaced by their domain
+MAX_URL_LENGTH = 40
+# Earlier messages of a thread summarized next to the newest one, and characters kept from each
+THREAD_CONTEXT_MESSAGES = 4
+THREAD_CONTEXT_CHARS = 300
+
+# Start of quoted history: everything from the first match on is dropped
+QUOTE_START = re.compile(
+    r"^\s*(on .{0,200}wrote:|-{2,}\s*original message\s*-{2,}|-{2,}\s*forwarded message\s*-{2,}"
+    r"|_{10,}|from:\s.+\n\s*(sent|date):\s)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Start of a signature block
+SIGNATURE_START = re.compile(r"^(--\s*|sent from my \w+.*|get outlook for \w+.*)$", re.IGNORECASE | re.MULTILINE)
+# Footer lines that never carry the application status
+BOILERPLATE = re.compile(
+    r"unsubscribe|manage (your )?(email )?preferences|privacy (policy|notice)|view (it )?in (your )?browser"
+    r"|all rights reserved|©|\(c\) \d{4}|this (e-?mail|message) (and any attachments )?(is|was|may be) (intended|sent|confidential)"
+    r"|confidentiality notice|do not reply|please don'?t reply|no-?reply|you (are )?receiv(ed|ing) this",
+    re.IGNORECASE,
+)
+URL = re.compile(r"https?://[^\s<>()\"']+")
+
+# Words that mark the sentences the classifier actually needs
+SIGNAL = re.compile(
+    r"\b(appl(y|ied|ying|ication)|candida(te|cy)|position|role|interview\w*|offer\w*|unfortunately|regret"
+    r"|not (to )?(move|moving) forward|other candidates|next steps?|assessment|schedul\w*|recruit\w*|hiring"
+    r"|received|reviewing|thank you|thanks|decision|team|status)\b",
+    re.IGNORECASE,
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Running totals for this process, for the chars-saved report
+COUNTERS = Counter()
+
+def _short_url(match):
+    url = match.group(0)
+    if len(url) <= MAX_URL_LENGTH:
+        return url
+    return f"[link: {url.split('/')[2]}]"
+
+def clean_body(body):
+    """Strip quoted history, signatures, footers and long URLs, and collapse whitespace."""
+    text = (body or "").replace("\r\n", "\n").replace("\r", "\n")
+
+    for pattern in (QUOTE_START, SIGNATURE_START):
+        match = pattern.search(text)
+        # Never cut the whole email away, e.g. a message that is only a forward
+        if match and text[:match.start()].strip():
+            text = text[:match.start()]
+
+    lines = []
+    for line in text.split("\n"):
+        if line.lstrip().startswith(">"):
+            continue
+        if BOILERPLATE.search(line):
+            # HTML mail arrives one paragraph per line, so only the boilerplate sentences go
+            line = " ".join(s for s in SENTENCE_END.split(line) if s.strip() and not BOILERPLATE.search(s))
+            if not line:
+                continue
+        lines.append(re.sub(r"[ \t\xa0]+", " ", URL.sub(_short_url, line)).strip())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def _top_sentences(text, budget):
+    # Keep the best scoring sentences that fit, in their original order.
+    # Earlier sentences win ties; the opening lines usually say what the email is about.
+    sentences = [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-len(SIGNAL.findall(sentences[i])), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        cost = len(sentences[i]) + 1
+        if used + cost <= budget:
+            chosen.append(i)
+            used += cost
+    if not chosen:
+        # Not even one sentence fits; fall back to the opening text
+        return text[:budget]
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+def thread_context(messages):
+    """Compact summary of a thread's earlier messages (oldest first): sender, date and the opening of each cleaned body."""
+    lines = []
+    for msg in messages[-THREAD_CONTEXT_MESSAGES:]:
+        text = re.sub(r"\s+", " ", clean_body(msg.get("body")))[:THREAD_CONTEXT_CHARS]
+        lines.append(f"- {msg.get('date') or 'Unknown date'} | {msg.get('sender') or 'Unknown sender'}: {text}")
+    return "\n".join(lines)
+
+def raw_chars(msg):
+    """Characters the scan used to send for one message: untouched subject + body, cut at UNPROCESSED_TEXT_LIMIT."""
+    return min(len(f"Subject: {msg['subject']}\n\nBody:\n{msg['body']}"), UNPROCESSED_TEXT_LIMIT)
+
+def prepare_email(subject, body, budget=None, context=None):
+    """
+    The text classified for one email: subject plus the cleaned body, within
+    `budget` characters. `context` (see thread_context) gets whatever room the
+    body leaves.
+    """
+    budget = EMAIL_TEXT_BUDGET if budget is None else budget
+    head = f"Subject: {subject}\n\nBody:\n"
+    body = clean_body(body)
+    if len(head) + len(body) > budget:
+        body = _top_sentences(body, max(0, budget - len(head)))
+    text = head + body
+    if context:
+        text += f"\n\nEarlier in this thread:\n{context}"
+    return text[:budget]
+
+def prepare_emails(messages, budget=None):
+    """
+    Build the LLM text for each message dict. Returns [(message_id, text)]
+    and a stats dict of characters in and out for reporting.
+    """
+    texts = []
+    chars_in = 0
+    for msg in messages:
+        # Measured against the untouched subject + body the scan used to send, including
+        # the earlier messages of a collapsed thread (which it sent one by one)
+        chars_in += raw_chars(msg) + msg.get("thread_chars", 0)
+        texts.append((msg["id"], prepare_email(msg["subject"], msg["body"], budget, msg.get("thread_context"))))
+    chars_out = sum(len(text) for _, text in texts)
+
+    COUNTERS["emails"] += len(texts)
+    COUNTERS["chars_saved"] += chars_in - chars_out
+    stats = {"emails": len(texts), "chars_in": chars_in, "chars_out": chars_out}
+    return texts, stats
+
+def average_saved(emails, chars_saved):
+    return round(chars_saved / emails) if emails else 0
@@ -0,0 +1,416 @@
+import asyncio
+import datetime
+import os
+import random
+import threading
+from collections import deque
+import httpx
+from .email_body import extract_body
+
+# Async Gmail REST client on a shared httpx.AsyncClient (HTTP/2, pooled connections).
+# Request handlers await it directly; scan threads go through run() and iter_blocking(),
+# which drive it on one background event loop shared by every scan in the process.
+
+GMAIL_API_URL = os.getenv("GMAIL_API_URL", "https://gmail.googleapis.com/gmail/v1")
+# Max number of messages.get requests in flight at once, per event loop
+GMAIL_GET_CONCURRENCY = int(os.getenv("GMAIL_GET_CONCURRENCY", "25"))
+# Max number of Gmail connections kept open for reuse by each event loop
+GMAIL_HTTP_POOL_SIZE = int(os.getenv("GMAIL_HTTP_POOL_SIZE", "16"))
+GMAIL_HTTP_TIMEOUT = int(os.getenv("GMAIL_HTTP_TIMEOUT", "60"))
+# Max number of ignored senders turned into -from: terms in the search query
+GMAIL_QUERY_MAX_EXCLUDES = int(os.getenv("GMAIL_QUERY_MAX_EXCLUDES", "50"))
+
+# Max number of 50-message chunks a scan fetches ahead of the consumer
+GMAIL_BATCH_CONCURRENCY = int(os.getenv("GMAIL_BATCH_CONCURRENCY", "4"))
+# Max number of times a failed request is retried before the message is given up on
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "4"))
+# Backoff before retry n is GMAIL_RETRY_BASE_DELAY * 2**(n-1) seconds (capped), with jitter
+GMAIL_RETRY_BASE_DELAY = float(os.getenv("GMAIL_RETRY_BASE_DELAY", "1.0"))
+GMAIL_RETRY_MAX_DELAY = 32.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+class HistoryExpired(Exception):
+    """The stored historyId is too old for users.history.list."""
+
+# Messages in these labels are never job application updates
+SKIPPED_LABELS = {"SENT", "DRAFT", "SPAM", "TRASH"}
+
+# Headers needed to decide whether a message is worth downloading in full
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+# Partial-response masks so Gmail only sends the fields we read
+METADATA_FIELDS = 'id,threadId,payload/headers'
+FULL_FIELDS = 'id,threadId,snippet,payload'
+
+class GmailError(Exception):
+    """A Gmail API call answered with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Gmail API error {status}: {message}")
+        self.status = status
+
+class _LoopState:
+    # httpx connections are bound to the event loop that opened them, so each loop gets its own
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=GMAIL_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=GMAIL_HTTP_POOL_SIZE, max_keepalive_connections=GMAIL_HTTP_POOL_SIZE),
+        )
+        self.gets = asyncio.Semaphore(max(1, GMAIL_GET_CONCURRENCY))
+
+_states = {}
+
+def _state():
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        state = _states[loop] = _LoopState()
+    return state
+
+async def close_client():
+    """Close the running loop's client. Called on app shutdown."""
+    state = _states.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state.client.aclose()
+
+def _bump(stats, key, n):
+    # Only touched from the event loop, so no lock needed
+    if stats is not None and n:
+        stats[key] = stats.get(key, 0) + n
+
+def _is_retryable(error):
+    if isinstance(error, GmailError):
+        if error.status in RETRYABLE_STATUSES:
+            return True
+        # Gmail reports per-user rate limits as 403
+        return error.status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+    # Connection resets, timeouts, etc.
+    return isinstance(error, httpx.TransportError)
+
+async def _request(token, path, params=None, stats=None):
+    """GET a users/me/ endpoint, retrying rate-limited and transient failures with backoff and jitter."""
+    attempt = 0
+    while True:
+        try:
+            response = await _state().client.get(
+                f"{GMAIL_API_URL}/users/me/{path}", params=params,
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            if response.status_code >= 400:
+                raise GmailError(response.status_code, response.text)
+            return response.json()
+        except Exception as e:
+            attempt += 1
+            if attempt > GMAIL_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = min(GMAIL_RETRY_MAX_DELAY, GMAIL_RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            _bump(stats, "retried", 1)
+            await asyncio.sleep(delay)
+
+def _params(**params):
+    # Gmail expects camelCase names; unset ones are left out
+    return {key: value for key, value in params.items() if value is not None}
+
+def _search_query(exclude_senders=None, after=None):
+    # Calculate date 45 days ago, unless a start (epoch seconds) is given
+    if after is None:
+        after = (datetime.datetime.now() - datetime.timedelta(days=45)).strftime('%Y/%m/%d')
+
+    # Smart Query: Search Subject AND Body for keywords.
+    # Added date filter to only look at emails from the last 45 days.
+    query = f'(application OR applied OR interview OR offer OR rejection OR update OR status OR "next steps" OR "thank you" OR "job description" OR "candidacy" OR "hiring" OR "recruiter" OR "talent") -from:calendar-notification@google.com after:{after}'
+
+    # Ignored senders are never listed or fetched. Past the cap the scan's own
+    # matcher still drops them, after the metadata fetch. Quoted so a value is
+    # always one term.
+    for sender in (exclude_senders or [])[:GMAIL_QUERY_MAX_EXCLUDES]:
+        query += f' -from:"{sender}"'
+    return query
+
+def _parse_headers(response):
+    headers = response.get('payload', {}).get("headers", [])
+
+    subject = ""
+    sender = ""
+    date = ""
+
+    for h in headers:
+        name = h.get("name", "").lower()
+        if name == "subject":
+            subject = h.get("value")
+        if name == "from":
+            sender = h.get("value")
+        if name == "date":
+            date = h.get("value")
+
+    return {
+        "id": response['id'],
+        "subject": subject,
+        "sender": sender,
+        "date": date,
+        "thread_id": response['threadId']
+    }
+
+def parse_email(response):
+    """Turn a messages.get response (format=full) into the email dict a scan classifies."""
+    body = extract_body(response.get('payload', {}))
+
+    # Fallback to snippet
+    if not body or len(body.strip()) == 0:
+        body = response.get('snippet', '')
+
+    email = _parse_headers(response)
+    email["body"] = body
+    return email
+
+def chunk_by_thread(messages, size=50):
+    """
+    Split listed messages into id chunks of up to `size`, keeping each thread's
+    messages together (threads in order of first appearance) so a scan can
+    collapse them. Only threads longer than `size` are split.
+    """
+    threads = {}
+    for msg in messages:
+        threads.setdefault(msg.get('threadId') or msg['id'], []).append(msg['id'])
+
+    chunks = []
+    current = []
+    for ids in threads.values():
+        if current and len(current) + len(ids) > size:
+            chunks.append(current)
+            current = []
+        for message_id in ids:
+            if len(current) >= size:
+                chunks.append(current)
+                current = []
+            current.append(message_id)
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def get_profile(token):
+    return await _request(token, "profile")
+
+async def list_messages(token, q=None, max_results=100, page_token=None):
+    return await _request(token, "messages", _params(q=q, maxResults=max_results, pageToken=page_token))
+
+async def get_message(token, message_id, format="full", fields=None, metadata_headers=None, stats=None):
+    params = _params(format=format, fields=fields, metadataHeaders=metadata_headers)
+    return await _request(token, f"messages/{message_id}", params, stats=stats)
+
+async def list_history(token, start_history_id, history_types=("messageAdded",), max_results=500, page_token=None):
+    params = _params(startHistoryId=start_history_id, historyTypes=list(history_types), maxResults=max_results, pageToken=page_token)
+    try:
+        return await _request(token, "history", params)
+    except GmailError as e:
+        # Gmail answers 404 once the cursor is older than its history retention
+        if e.status == 404:
+            raise HistoryExpired(str(e))
+        raise
+
+async def get_messages(token, message_ids, stats=None, **kwargs):
+    """
+    Fetch messages with concurrent messages.get calls, in list order. Messages
+    still failing after all retries are left out and counted as lost in `stats`.
+    """
+    gets = _state().gets
+
+    async def get(message_id):
+        async with gets:
+            try:
+                return await get_message(token, message_id, stats=stats, **kwargs)
+            except Exception as e:
+                print(f"Error fetching message {message_id}: {e}")
+                _bump(stats, "lost", 1)
+                return None
+
+    responses = await asyncio.gather(*(get(message_id) for message_id in message_ids))
+    return [response for response in responses if response is not None]
+
+async def _search_message_ids(token, max_results, exclude_senders=None):
+    print(f"Fetching list of up to {max_results} emails...")
+    messages = []
+    next_page_token = None
+    query = _search_query(exclude_senders)
+
+    while len(messages) < max_results:
+        results = await list_messages(token, q=query, max_results=min(100, max_results - len(messages)), page_token=next_page_token)
+        page_messages = results.get('messages', [])
+        messages.extend(page_messages)
+
+        next_page_token = results.get('nextPageToken')
+        if not next_page_token or len(page_messages) == 0:
+            break
+
+    print(f"Found {len(messages)} message IDs. Fetching details...")
+    return messages
+
+async def _list_history_message_ids(token, start_history_id, max_results):
+    """
+    The messages added since start_history_id, oldest first, and the historyId
+    to resume from. Past max_results the list is cut and the returned cursor is
+    the last history record fully included, so the rest is picked up next scan.
+    """
+    messages = []
+    seen = set()
+    latest_history_id = start_history_id
+    complete_history_id = start_history_id
+    next_page_token = None
+
+    while True:
+        results = await list_history(token, start_history_id, page_token=next_page_token)
+        for record in results.get('history', []):
+            added = []
+            for entry in record.get('messagesAdded', []):
+                msg = entry.get('message', {})
+                if msg.get('id') in seen or SKIPPED_LABELS & set(msg.get('labelIds', [])):
+                    continue
+                seen.add(msg['id'])
+                added.append({'id': msg['id'], 'threadId': msg.get('threadId')})
+            if len(messages) + len(added) > max_results:
+                messages.extend(added[:max_results - len(messages)])
+                # A record bigger than the whole limit still has to move the cursor forward
+                cursor = complete_history_id if complete_history_id != start_history_id else record.get('id', start_history_id)
+                print(f"History has more than {max_results} new messages, resuming from historyId {cursor} next scan")
+                return messages, cursor
+            messages.extend(added)
+            complete_history_id = record.get('id', complete_history_id)
+
+        latest_history_id = results.get('historyId', latest_history_id)
+        next_page_token = results.get('nextPageToken')
+        if not next_page_token:
+            break
+
+    return messages, latest_history_id
+
+async def _filter_by_search(token, messages, exclude_senders=None):
+    """
+    Keep the history messages the full search would list too (same keywords and
+    excluded senders), so new promo and social mail is never fetched or
+    classified. Only mail from a day before the oldest new message on is searched.
+    """
+    if not messages:
+        return messages
+    try:
+        oldest = await get_message(token, messages[0]['id'], format='minimal', fields='internalDate')
+        after = int(oldest['internalDate']) // 1000 - 86400
+    except (GmailError, KeyError, ValueError):
+        # e.g. the message was deleted since; the default 45 day window still works
+        after = None
+
+    query = _search_query(exclude_senders, after=after)
+    matching = set()
+    page_token = None
+    while True:
+        results = await list_messages(token, q=query, max_results=500, page_token=page_token)
+        matching.update(msg['id'] for msg in results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    return [msg for msg in messages if msg['id'] in matching]
+
+async def _fetch_chunk(token, message_ids, select, select_lock, stats):
+    if select is not None:
+        # Phase 1: headers only, then keep the messages worth a full download
+        responses = await get_messages(token, message_ids, stats=stats, format='metadata',
+                                       fields=METADATA_FIELDS, metadata_headers=METADATA_HEADERS)
+        metas = [_parse_headers(response) for response in responses]
+        # select() may touch a DB session, so calls are serialized and kept off the event loop
+        async with select_lock:
+            message_ids = [meta['id'] for meta in await asyncio.to_thread(select, metas)]
+
+    if not message_ids:
+        return []
+    # Phase 2: full bodies
+    responses = await get_messages(token, message_ids, stats=stats, format='full', fields=FULL_FIELDS)
+    return [parse_email(response) for response in responses]
+
+async def iter_message_batches(token, messages, select=None, stats=None):
+    """
+    Async generator over the emails of `messages`, one list per chunk of up
+    to 50 with threads kept together (see chunk_by_thread). Up to
+    GMAIL_BATCH_CONCURRENCY chunks are fetched ahead of the consumer.
+    If `select` is given, each chunk is first fetched as metadata only
+    (Subject/From/Date) and `select(metas)` returns the metadata dicts worth
+    downloading in full. Retry and loss counts are added to `stats`.
+    """
+    chunks = chunk_by_thread(messages)
+    select_lock = asyncio.Lock()
+    total = 0
+
+    in_flight = deque()
+    try:
+        for i, chunk in enumerate(chunks):
+            print(f"Fetching chunk {i + 1} of {len(chunks)}...")
+            in_flight.append(asyncio.ensure_future(_fetch_chunk(token, chunk, select, select_lock, stats)))
+            if len(in_flight) >= GMAIL_BATCH_CONCURRENCY:
+                email_data = await in_flight.popleft()
+                total += len(email_data)
+                yield email_data
+        while in_flight:
+            email_data = await in_flight.popleft()
+            total += len(email_data)
+            yield email_data
+    finally:
+        # Stops chunks still in flight when the consumer stops early
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    print(f"Fetched {total} full emails.")
+
+async def stream_emails(token, start_history_id=None, max_results=250, select=None, stats=None, exclude_senders=None):
+    """
+    List the emails for a scan and return (batches, history_id).
+
+    `batches` is an async generator of email lists (see iter_message_batches).
+    With a start_history_id only messages added since then are listed via
+    users.history.list, narrowed to the ones the keyword search also matches.
+    Without one, or once it has expired, this falls back to the bounded keyword
+    search. Both leave out exclude_senders. The
+    returned history_id is the cursor to store for the next scan.
+    """
+    if start_history_id:
+        try:
+            messages, history_id = await _list_history_message_ids(token, start_history_id, max_results)
+            added = len(messages)
+            messages = await _filter_by_search(token, messages, exclude_senders)
+            print(f"Incremental sync from historyId {start_history_id}: {added} new messages, {len(messages)} match the search")
+            return iter_message_batches(token, messages, select=select, stats=stats), history_id
+        except HistoryExpired:
+            print(f"historyId {start_history_id} expired, falling back to full search")
+
+    # Take the cursor before searching so mail arriving mid-scan is picked up next time
+    history_id = (await get_profile(token)).get('historyId')
+    messages = await _search_message_ids(token, max_results, exclude_senders)
+    return iter_message_batches(token, messages, select=select, stats=stats), history_id
+
+# Background event loop for callers on plain threads (the scan pipeline)
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gmail-async", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def run(coro):
+    """Run a coroutine on the background loop and block the calling thread until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+def iter_blocking(batches):
+    """Iterate an async generator from a plain thread, one item per round-trip to the background loop."""
+    try:
+        while True:
+            try:
+                yield run(batches.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run(batches.aclose())
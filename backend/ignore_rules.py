@@ -0,0 +1,113 @@
+import re
+from email.utils import parseaddr
+from sqlalchemy import delete, or_
+from sqlalchemy.orm import Session
+from .models import IgnoreRule, JobApplication
+from .analytics_service import RollupDelta, record_job_changes
+
+# Senders a user never wants tracked. A rule is either an exact address
+# ("newsletter@company.com") or a domain ("company.com" or "@company.com"),
+# which also covers its subdomains.
+
+ADDRESS = "address"
+DOMAIN = "domain"
+
+# What a rule value may look like; anything else (spaces, quotes, Gmail search
+# operators) would change the meaning of the -from: terms built from it
+LOCAL_PART = re.compile(r"^[a-z0-9._%+-]+$")
+DOMAIN_NAME = re.compile(r"^[a-z0-9-]+(\.[a-z0-9-]+)+$")
+
+def split_sender(sender):
+    """Return the lowercased (address, domain) of a From header, or (None, None)."""
+    address = parseaddr(sender or "")[1].strip().lower()
+    if "@" not in address:
+        return None, None
+    return address, address.rsplit("@", 1)[1] or None
+
+def domain_matches(domain, domains):
+    """
+    Whether a domain or any of its parent domains (e.g. hire.lever.co for
+    lever.co) is in the `domains` set. A bare TLD never matches.
+    """
+    parts = (domain or "").split(".")
+    return any(".".join(parts[i:]) in domains for i in range(len(parts) - 1))
+
+class IgnoreMatcher:
+    """A user's rules compiled into hash sets, built once per scan."""
+
+    def __init__(self, rules):
+        self.addresses = {value for kind, value in rules if kind == ADDRESS}
+        self.domains = {value for kind, value in rules if kind == DOMAIN}
+
+    def __bool__(self):
+        return bool(self.addresses or self.domains)
+
+    def matches(self, sender):
+        address, domain = split_sender(sender)
+        if not address:
+            return False
+        if address in self.addresses:
+            return True
+        return domain_matches(domain, self.domains)
+
+    def senders(self):
+        """Every rule value, for -from: terms in a Gmail search."""
+        return sorted(self.addresses) + sorted(self.domains)
+
+def parse_rules(text):
+    """
+    Parse the comma separated list from the settings form into (kind, value)
+    rules. Entries that aren't an address or a domain are dropped.
+    """
+    rules = []
+    for entry in (text or "").split(","):
+        entry = entry.strip().lower()
+        if not entry:
+            continue
+        local, _, domain = entry.rpartition("@")
+        if not DOMAIN_NAME.match(domain) or (local and not LOCAL_PART.match(local)):
+            continue
+        rule = (ADDRESS, entry) if local else (DOMAIN, domain)
+        if rule not in rules:
+            rules.append(rule)
+    return rules
+
+def format_rules(rules):
+    return ", ".join(value for _, value in rules)
+
+def get_rules(db: Session, user_id: int):
+    return [
+        (kind, value) for kind, value in db.query(IgnoreRule.kind, IgnoreRule.value).filter(
+            IgnoreRule.user_id == user_id
+        ).order_by(IgnoreRule.id)
+    ]
+
+def replace_rules(db: Session, user_id: int, rules):
+    """Swap the user's rules for a new list. Does not commit."""
+    db.query(IgnoreRule).filter(IgnoreRule.user_id == user_id).delete(synchronize_session=False)
+    db.add_all(IgnoreRule(user_id=user_id, kind=kind, value=value) for kind, value in rules)
+    db.flush()
+
+def prune_ignored_jobs(db: Session, user_id: int, rules):
+    """Delete the user's jobs from ignored senders in one statement. Returns how many were deleted."""
+    addresses = [value for kind, value in rules if kind == ADDRESS]
+    domains = [value for kind, value in rules if kind == DOMAIN]
+    conditions = []
+    if addresses:
+        conditions.append(JobApplication.sender_address.in_(addresses))
+    if domains:
+        conditions.append(JobApplication.sender_domain.in_(domains))
+        conditions.extend(JobApplication.sender_domain.like(f"%.{domain}") for domain in domains)
+    if not conditions:
+        return 0
+
+    deleted = db.execute(
+        delete(JobApplication).where(JobApplication.user_id == user_id, or_(*conditions))
+        .returning(JobApplication.status, JobApplication.date_applied)
+    ).all()
+    if deleted:
+        delta = RollupDelta()
+        for status, date_applied in deleted:
+            delta.remove(status, date_applied)
+        record_job_changes(db, user_id, delta)
+    return len(deleted)
@@ -1,6 +1,7 @@
 from google import genai
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,59 +9,241 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=GEMINI_API_KEY)
 
-def parse_job_application(email_text):
-    prompt = f"""
-    Analyze the following email and extract job application details.
-    
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Bump whenever the prompts change so cached classifications are redone
+PROMPT_VERSION = "1"
+
+# Max number of Gemini requests in flight at once during a scan
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Max number of emails packed into one batched prompt (1 disables batching)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+# Max number of email characters packed into one batched prompt
+LLM_BATCH_CHAR_BUDGET = int(os.getenv("LLM_BATCH_CHAR_BUDGET", "40000"))
+
+# Shared instructions for the single and batched prompts
+INSTRUCTIONS = """
     Goal: Identify ANY job application related emails (confirmations, updates, rejections, offers).
     BE AGGRESSIVE. If it looks like a job application update, extract it.
-    
+
     Return a JSON object with the following fields:
     - company_name: str (Infer from subject or body. e.g. "MongoDB", "Salesforce")
     - job_title: str (Infer from subject or body. If unknown, use "Software Engineer" or "Candidate")
     - status: One of ["APPLIED", "INTERVIEWING", "REJECTED", "OFFER"]
     - date_applied: str (YYYY-MM-DD if extracted, else use today's date)
     - notes: str (Brief summary, e.g. "Application received", "Rejected")
-    
+
     Heuristics to determine Status:
     - "Application Update", "Update on your application", "Thank you for applying", "You have officially applied" -> APPLIED
     - "Thank you for your interest", "not moving forward", "unfortuntely", "not selected" -> REJECTED
     - "Interview", "Schedule a time", "Chat" -> INTERVIEWING
     - "Offer", "Congratulations" -> OFFER
-    
+
     If the email is purely a job alert, newsletter, or spam (e.g. "New match:", "Job opportunities at"), return null.
-    
+"""
+
+def _generate(prompt):
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt
+    )
+    return response.text
+
+def _strip_code_fences(raw_text):
+    # Cleanup code blocks
+    text = raw_text.strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        # Remove first line if it starts with ```
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        # Remove last line if it starts with ```
+        if lines[-1].startswith("```"):
+            lines = lines[:-1]
+        text = "\n".join(lines).strip()
+    return text
+
+def _classify(email_text):
+    # Raises on API or JSON errors so callers can tell failures apart from null
+    prompt = f"""
+    Analyze the following email and extract job application details.
+    {INSTRUCTIONS}
     Email Content:
     {email_text}
-    
+
     JSON Output:
     """
-    
+
     print(f"--- ANALYZING EMAIL (Len: {len(email_text)}) ---")
+    raw_text = _generate(prompt)
+    print(f"RAW LLM RESPONSE:\n{raw_text}\n-------------------")
+
+    text = _strip_code_fences(raw_text)
+
+    if text.lower() == "null":
+        return None
+
+    return json.loads(text)
+
+def parse_job_application(email_text):
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash', 
-            contents=prompt
-        )
-        raw_text = response.text
-        print(f"RAW LLM RESPONSE:\n{raw_text}\n-------------------")
-        
-        # Cleanup code blocks
-        text = raw_text.strip()
-        if text.startswith("```"):
-            lines = text.split("\n")
-            # Remove first line if it starts with ```
-            if lines[0].startswith("```"):
-                lines = lines[1:]
-            # Remove last line if it starts with ```
-            if lines[-1].startswith("```"):
-                lines = lines[:-1]
-            text = "\n".join(lines).strip()
-            
-        if text.lower() == "null":
-            return None
-            
-        return json.loads(text)
+        return _classify(email_text)
     except Exception as e:
         print(f"Error parsing with Gemini: {e}")
         return None
+
+def parse_job_applications_batch(emails):
+    """
+    Classify several emails with one prompt.
+
+    `emails` is a list of (message_id, email_text) pairs. Returns a dict of
+    message_id -> parsed result (None for non-job emails). Ids whose output is
+    missing or malformed are left out so the caller can retry them one by one.
+    """
+    sections = "\n".join(
+        f"=== MESSAGE {message_id} ===\n{email_text}\n=== END MESSAGE {message_id} ===\n"
+        for message_id, email_text in emails
+    )
+    prompt = f"""
+    Analyze each of the following emails independently and extract job application details.
+    {INSTRUCTIONS}
+    Each email starts with "=== MESSAGE <id> ===" and ends with "=== END MESSAGE <id> ===".
+    Return a JSON array with one entry per email, in the same order:
+    {{"message_id": "<id>", "result": <the JSON object described above, or null>}}
+
+    Emails:
+    {sections}
+
+    JSON Output:
+    """
+
+    print(f"--- ANALYZING BATCH OF {len(emails)} EMAILS (Len: {len(sections)}) ---")
+    try:
+        raw_text = _generate(prompt)
+        print(f"RAW LLM RESPONSE:\n{raw_text}\n-------------------")
+        items = json.loads(_strip_code_fences(raw_text))
+    except Exception as e:
+        print(f"Error parsing batch with Gemini: {e}")
+        return {}
+
+    if not isinstance(items, list):
+        print(f"Batch response is not a JSON array: {type(items).__name__}")
+        return {}
+
+    expected_ids = {str(message_id) for message_id, _ in emails}
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        message_id = str(item.get("message_id"))
+        if message_id not in expected_ids or "result" not in item:
+            continue
+        result = item["result"]
+        if result is None or isinstance(result, dict):
+            results[message_id] = result
+    return results
+
+def _pack_batches(emails, batch_size, char_budget):
+    # Greedily fill each batch up to batch_size emails or char_budget characters
+    batches = []
+    current = []
+    current_chars = 0
+    for message_id, email_text in emails:
+        if current and (len(current) >= batch_size or current_chars + len(email_text) > char_budget):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append((message_id, email_text))
+        current_chars += len(email_text)
+    if current:
+        batches.append(current)
+    return batches
+
+# Marks an email whose classification failed (as opposed to a null result)
+_FAILED = object()
+
+def _safe_parse(email_text):
+    # One bad email must never take down the rest of the scan
+    try:
+        return _classify(email_text)
+    except Exception as e:
+        print(f"Error classifying email: {e}")
+        return _FAILED
+
+def _safe_parse_batch(batch):
+    if len(batch) == 1:
+        message_id, email_text = batch[0]
+        return {str(message_id): _safe_parse(email_text)}
+
+    try:
+        results = parse_job_applications_batch(batch)
+    except Exception as e:
+        print(f"Error classifying batch: {e}")
+        results = {}
+
+    # Fall back to single-email calls for anything the batch didn't answer
+    for message_id, email_text in batch:
+        if str(message_id) not in results:
+            print(f"No valid batch result for {message_id}, retrying on its own...")
+            results[str(message_id)] = _safe_parse(email_text)
+    return results
+
+def submit_job_applications(executor, emails, batch_size=None):
+    """
+    Queue (message_id, email_text) pairs on `executor`, packed into batched
+    prompts. Returns one future per prompt, each resolving to a dict of
+    message_id -> result; pass them to collect_results.
+    """
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+    return [executor.submit(_safe_parse_batch, batch) for batch in _pack_batches(emails, batch_size, LLM_BATCH_CHAR_BUDGET)]
+
+def collect_results(emails, batch_results, failed_ids=None):
+    """
+    Results of submitted prompts in `emails` order. Emails that could not be
+    classified come back as None and, if `failed_ids` is given, their ids are
+    added to it.
+    """
+    results = {}
+    for batch_result in batch_results:
+        results.update(batch_result)
+
+    ordered = []
+    for message_id, _ in emails:
+        result = results.get(str(message_id), _FAILED)
+        if result is _FAILED:
+            if failed_ids is not None:
+                failed_ids.add(message_id)
+            result = None
+        ordered.append(result)
+    return ordered
+
+def parse_job_applications(emails, batch_size=None, max_concurrency=None, failed_ids=None, on_progress=None):
+    """
+    Classify many emails concurrently, packing several into each prompt.
+
+    `emails` is a list of (message_id, email_text) pairs. Results are returned
+    in input order. Emails that could not be classified come back as None and,
+    if `failed_ids` is given, their ids are added to it. `on_progress` is called
+    with the number of emails in each finished batch; if it raises, batches
+    that haven't started yet are cancelled and the exception propagates.
+    """
+    if not emails:
+        return []
+
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+    batches = _pack_batches(emails, batch_size, LLM_BATCH_CHAR_BUDGET)
+
+    workers = max(1, min(max_concurrency or LLM_MAX_CONCURRENCY, len(batches)))
+    print(f"Classifying {len(emails)} emails in {len(batches)} batches with up to {workers} requests in flight...")
+    batch_results = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_safe_parse_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            batch_results.append(future.result())
+            if on_progress:
+                on_progress(len(batch_results[-1]))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return collect_results(emails, batch_results, failed_ids)
@@ -3,10 +3,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from .auth import router as auth_router
 from .routers.scan import router as scan_router
 from .database import engine, Base
+from .gmail_async import close_client as close_gmail_client
+from contextlib import asynccontextmanager
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="NextSteps API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Shared Gmail HTTP/2 connections of the app's event loop
+    await close_gmail_client()
+
+app = FastAPI(title="NextSteps API", lifespan=lifespan)
 
 import os
 
@@ -30,6 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 app.include_router(auth_router)
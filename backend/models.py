@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Enum, Index, Boolean
 from sqlalchemy.orm import relationship
 import enum
 from datetime import datetime
@@ -10,6 +10,13 @@ class JobStatus(str, enum.Enum):
     REJECTED = "REJECTED"
     OFFER = "OFFER"
 
+class ScanStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -17,7 +24,9 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     name = Column(String, nullable=True)
     picture = Column(String, nullable=True)
-    ignored_emails = Column(Text, default="") # Comma separated list of emails to ignore
+    ignored_emails = Column(Text, default="") # Legacy comma separated list, now copied into ignore_rules
+    gmail_history_id = Column(String, nullable=True) # Gmail sync cursor from the last completed scan
+    jobs_version = Column(Integer, default=0) # Bumped on every change to the user's jobs, used for ETags
     
     jobs = relationship("JobApplication", back_populates="owner")
 
@@ -31,7 +40,94 @@ class JobApplication(Base):
     status = Column(Enum(JobStatus), default=JobStatus.APPLIED)
     date_applied = Column(DateTime, default=datetime.utcnow)
     sender_email = Column(String, nullable=True) # To filter/delete by sender later
+    sender_address = Column(String, nullable=True) # Lowercased address from sender_email, matched by ignore rules
+    sender_domain = Column(String, nullable=True)
     email_thread_link = Column(String, nullable=True)
+    thread_id = Column(String, nullable=True) # Gmail thread the application was found in
+    status_updated_at = Column(DateTime, nullable=True) # Date of the email or edit that set the status; date_applied if unset
     notes = Column(Text, nullable=True)
     
     owner = relationship("User", back_populates="jobs")
+
+    __table_args__ = (
+        # One row per role per user; scans upsert against this
+        Index("uq_job_applications_user_company_title", "user_id", "company_name", "job_title", unique=True),
+        Index("ix_job_applications_user_thread", "user_id", "thread_id"),
+        # Stats by week, and keyset pagination on (date_applied, id)
+        Index("ix_job_applications_user_date", "user_id", "date_applied", "id"),
+        Index("ix_job_applications_user_sender_address", "user_id", "sender_address"),
+        Index("ix_job_applications_user_sender_domain", "user_id", "sender_domain"),
+    )
+
+class IgnoreRule(Base):
+    __tablename__ = "ignore_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False) # "address" or "domain"
+    value = Column(String, nullable=False) # Lowercased address, or domain without the @
+
+    __table_args__ = (
+        Index("uq_ignore_rules_user_kind_value", "user_id", "kind", "value", unique=True),
+    )
+
+class ClassificationCache(Base):
+    __tablename__ = "classification_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Message ids are only unique within one mailbox
+    message_id = Column(String, nullable=False)
+    body_hash = Column(String(64), nullable=False) # sha256 of the text sent to the LLM
+    model_name = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    result = Column(Text, nullable=False) # JSON result, "null" for non-job emails
+    subject = Column(String, nullable=True) # Kept as training data for the pre-filter
+    sender = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_classification_cache_user_lookup", "user_id", "message_id", "model_name", "prompt_version"),
+    )
+
+class ScanJob(Base):
+    __tablename__ = "scan_jobs"
+
+    id = Column(String(32), primary_key=True) # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(Enum(ScanStatus), default=ScanStatus.PENDING)
+    full = Column(Boolean, default=False)
+    cancel_requested = Column(Boolean, default=False)
+
+    # Progress counters, updated while the scan runs
+    fetched = Column(Integer, default=0)
+    classified = Column(Integer, default=0)
+    persisted = Column(Integer, default=0)
+
+    message = Column(Text, nullable=True)
+    result = Column(Text, nullable=True) # JSON with debug logs and pre-filter stats
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class AuthTokenCache(Base):
+    __tablename__ = "auth_token_cache"
+
+    token_hash = Column(String(64), primary_key=True) # sha256 of the Google access token
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class JobStatusRollup(Base):
+    __tablename__ = "job_status_rollup"
+
+    # Number of a user's applications in each status, kept in step with job writes
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class JobWeekRollup(Base):
+    __tablename__ = "job_week_rollup"
+
+    # Number of a user's applications per week (keyed by the week's Monday)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,144 @@
+import math
+import os
+import re
+from collections import Counter
+from email.utils import parseaddr
+from sqlalchemy.orm import Session
+from .models import ClassificationCache
+from .ignore_rules import domain_matches
+
+# Cheap in-process scoring that runs before the LLM. Messages scoring below
+# PREFILTER_THRESHOLD are dropped without a Gemini call. 0 disables dropping.
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.15"))
+
+# Minimum examples of each class before the bag-of-words model is trusted
+PREFILTER_MIN_EXAMPLES = int(os.getenv("PREFILTER_MIN_EXAMPLES", "20"))
+# Max number of past outcomes used to train the model
+PREFILTER_MAX_EXAMPLES = int(os.getenv("PREFILTER_MAX_EXAMPLES", "5000"))
+
+# Applicant tracking systems and recruiting platforms (likely real applications)
+CANDIDATE_DOMAINS = {
+    "greenhouse.io", "greenhouse-mail.io", "lever.co", "hire.lever.co", "myworkday.com",
+    "myworkdayjobs.com", "ashbyhq.com", "smartrecruiters.com", "icims.com", "jobvite.com",
+    "workablemail.com", "taleo.net", "successfactors.com", "bamboohr.com",
+}
+
+# Job boards' alert senders and generic marketing platforms (almost never applications)
+NOISE_DOMAINS = {
+    "jobalerts.linkedin.com", "jobs-listings.linkedin.com", "news.linkedin.com",
+    "alert.indeed.com", "match.indeed.com",
+    "substack.com", "medium.com", "mailchimp.com", "sendgrid.net", "quora.com",
+}
+
+CANDIDATE_SUBJECT = re.compile(
+    r"\b(your application|thank you for applying|thanks for applying|application (received|update|status)"
+    r"|interview|next steps|offer letter|candidacy|we received your)\b",
+    re.IGNORECASE,
+)
+
+NOISE_SUBJECT = re.compile(
+    r"\b(job alert|new jobs?|jobs? (for|matching) you|recommended|newsletter|digest|webinar"
+    r"|% off|sale|receipt|your order|invoice|verify your email|password)\b",
+    re.IGNORECASE,
+)
+
+# Log-odds weights for the rule features
+DOMAIN_WEIGHT = 4.0
+CANDIDATE_SUBJECT_WEIGHT = 2.0
+NOISE_SUBJECT_WEIGHT = 3.0
+
+TOKEN_RE = re.compile(r"[a-z]{2,}")
+
+# Running totals for this process (how many messages never reached the LLM)
+COUNTERS = Counter()
+
+def sender_domain(sender):
+    address = parseaddr(sender or "")[1].lower()
+    return address.rsplit("@", 1)[-1] if "@" in address else ""
+
+def tokenize(subject, sender):
+    tokens = TOKEN_RE.findall((subject or "").lower())
+    domain = sender_domain(sender)
+    if domain:
+        tokens.append(f"domain:{domain}")
+    return tokens
+
+class BagOfWordsModel:
+    """Multinomial naive Bayes over subject words and sender domain."""
+
+    def __init__(self):
+        self.counts = {True: Counter(), False: Counter()}
+        self.totals = {True: 0, False: 0}
+        self.docs = {True: 0, False: 0}
+
+    def add(self, tokens, is_job):
+        self.counts[is_job].update(tokens)
+        self.totals[is_job] += len(tokens)
+        self.docs[is_job] += 1
+
+    @property
+    def trained(self):
+        return min(self.docs.values()) >= PREFILTER_MIN_EXAMPLES
+
+    def log_odds(self, tokens):
+        if not self.trained:
+            return 0.0
+        vocab = len(set(self.counts[True]) | set(self.counts[False])) or 1
+        score = math.log(self.docs[True] / self.docs[False])
+        for token in tokens:
+            p_job = (self.counts[True][token] + 1) / (self.totals[True] + vocab)
+            p_noise = (self.counts[False][token] + 1) / (self.totals[False] + vocab)
+            score += math.log(p_job / p_noise)
+        return score
+
+def train_model(db: Session, user_id):
+    """Build the model from the user's past LLM outcomes stored in the classification cache."""
+    model = BagOfWordsModel()
+    rows = db.query(
+        ClassificationCache.subject, ClassificationCache.sender, ClassificationCache.result
+    ).filter(
+        ClassificationCache.user_id == user_id,
+        ClassificationCache.subject.isnot(None)
+    ).order_by(ClassificationCache.id.desc()).limit(PREFILTER_MAX_EXAMPLES).all()
+
+    for subject, sender, result in rows:
+        model.add(tokenize(subject, sender), result != "null")
+    print(f"Pre-filter model trained on {model.docs[True]} job / {model.docs[False]} non-job emails (active: {model.trained})")
+    return model
+
+def score_message(msg, model=None):
+    """Return a 0-1 score of how likely a message is to be a job application email."""
+    domain = sender_domain(msg.get("sender"))
+    subject = msg.get("subject") or ""
+
+    log_odds = 0.0
+    if domain and domain_matches(domain, CANDIDATE_DOMAINS):
+        log_odds += DOMAIN_WEIGHT
+    elif domain and domain_matches(domain, NOISE_DOMAINS):
+        log_odds -= DOMAIN_WEIGHT
+    if CANDIDATE_SUBJECT.search(subject):
+        log_odds += CANDIDATE_SUBJECT_WEIGHT
+    if NOISE_SUBJECT.search(subject):
+        log_odds -= NOISE_SUBJECT_WEIGHT
+    if model is not None:
+        log_odds += model.log_odds(tokenize(subject, msg.get("sender")))
+
+    return 1 / (1 + math.exp(-max(-50.0, min(50.0, log_odds))))
+
+def filter_candidates(messages, model=None, threshold=None):
+    """
+    Split messages into (kept, dropped) using the pre-filter score.
+    Returns kept, dropped and a stats dict for reporting.
+    """
+    threshold = PREFILTER_THRESHOLD if threshold is None else threshold
+    kept, dropped = [], []
+    for msg in messages:
+        if score_message(msg, model) < threshold:
+            dropped.append(msg)
+        else:
+            kept.append(msg)
+
+    COUNTERS["scored"] += len(messages)
+    COUNTERS["dropped"] += len(dropped)
+    stats = {"scored": len(messages), "dropped": len(dropped), "threshold": threshold}
+    return kept, dropped, stats
@@ -1,96 +1,52 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..database import get_db
-from ..models import JobApplication, JobStatus
-from typing import Dict, List, Any
-from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db, AsyncSessionLocal
+from ..models import JobApplication, User
+from ..auth import get_current_user
+from ..analytics_service import compute_stats
 import csv
-import io
+import json
+import os
+import zlib
 from fastapi.responses import StreamingResponse
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
-@router.get("/stats")
-def get_analytics_stats(db: Session = Depends(get_db)):
-    # 1. Summary Counts
-    total = db.query(JobApplication).count()
-    # Active usually means "In Progress" (Applied + Interviewing)
-    active = db.query(JobApplication).filter(JobApplication.status.in_([JobStatus.APPLIED, JobStatus.INTERVIEWING])).count()
-    offers = db.query(JobApplication).filter(JobApplication.status == JobStatus.OFFER).count()
-    
-    # Response Rate: (Interviewing + Offer + Rejected) / Total
-    # i.e. Any status EXCEPT "APPLIED"
-    responded = db.query(JobApplication).filter(JobApplication.status != JobStatus.APPLIED).count()
+# Rows fetched from the database per round-trip while streaming an export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
 
-    # 2. Funnel Counts (Status Distribution)
-    # Group by status
-    status_counts_query = db.query(JobApplication.status, func.count(JobApplication.status)).group_by(JobApplication.status).all()
-    funnel_counts = {status.value: 0 for status in JobStatus} # Initialize all with 0
-    for status, count in status_counts_query:
-        if status in funnel_counts:
-            funnel_counts[status] = count
-        # Handle string status if stored as string in older records (though Enum usually handles this)
-        elif hasattr(status, 'value') and status.value in funnel_counts:
-             funnel_counts[status.value] = count
+@router.get("/stats")
+async def get_analytics_stats(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    return await db.run_sync(compute_stats, current_user.id)
 
-    # 3. Weekly Activity (Applications over last 12 weeks)
-    # We aggregate by "Week of" (Monday)
-    
-    start_date = datetime.now() - timedelta(weeks=12)
-    
-    # Get all jobs from last 12 weeks
-    recent_jobs = db.query(JobApplication).filter(JobApplication.date_applied >= start_date).all()
-    
-    weekly_map = {}
-    
-    # Initialize last 12 weeks buckets
-    today = datetime.now()
-    # Find most recent Monday
-    current_week_monday = today - timedelta(days=today.weekday())
-    
-    for i in range(12):
-        # Go backwards from current week
-        week_start = current_week_monday - timedelta(weeks=i)
-        key = week_start.strftime("%Y-%m-%d")
-        weekly_map[key] = 0
-        
-    for job in recent_jobs:
-        if job.date_applied:
-            # Find Monday for this date
-            job_monday = job.date_applied - timedelta(days=job.date_applied.weekday())
-            key = job_monday.strftime("%Y-%m-%d")
-            if key in weekly_map:
-                weekly_map[key] += 1
-            
-    # Convert to list and sort
-    weekly_activity = [{"week": k, "count": v} for k, v in weekly_map.items()]
-    weekly_activity.sort(key=lambda x: x['week'])
+async def _export_rows(user_id: int):
+    # Own session: the request's session may be closed while the response is still streaming
+    async with AsyncSessionLocal() as db:
+        stmt = select(
+            JobApplication.id,
+            JobApplication.company_name,
+            JobApplication.job_title,
+            JobApplication.status,
+            JobApplication.date_applied,
+            JobApplication.notes,
+            JobApplication.email_thread_link
+        ).where(JobApplication.user_id == user_id).order_by(JobApplication.id)
+        # Server-side cursor, EXPORT_BATCH_SIZE rows in memory at a time
+        result = await db.stream(stmt, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+        async for partition in result.partitions():
+            yield partition
 
-    return {
-        "summary": {
-            "total": total,
-            "active": active,
-            "offers": offers,
-            "response_rate": f"{(responded / total * 100):.1f}%" if total > 0 else "0%"
-        },
-        "funnel_counts": funnel_counts,
-        "weekly_activity": weekly_activity
-    }
+class _Echo:
+    # File-like object for csv.writer that hands each row back instead of buffering it
+    def write(self, value):
+        return value
 
-@router.get("/export")
-def export_jobs_csv(db: Session = Depends(get_db)):
-    jobs = db.query(JobApplication).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(["ID", "Company", "Job Title", "Status", "Date Applied", "Notes", "Email Link"])
-    
-    # Write data
-    for job in jobs:
-        writer.writerow([
+async def _csv_chunks(user_id: int):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["ID", "Company", "Job Title", "Status", "Date Applied", "Notes", "Email Link"])
+    async for rows in _export_rows(user_id):
+        yield "".join(writer.writerow([
             job.id,
             job.company_name,
             job.job_title,
@@ -98,12 +54,55 @@ def export_jobs_csv(db: Session = Depends(get_db)):
             job.date_applied.strftime("%Y-%m-%d") if job.date_applied else "",
             job.notes or "",
             job.email_thread_link or ""
-        ])
-        
-    output.seek(0)
-    
+        ]) for job in rows)
+
+async def _ndjson_chunks(user_id: int):
+    async for rows in _export_rows(user_id):
+        yield "".join(json.dumps({
+            "id": job.id,
+            "company_name": job.company_name,
+            "job_title": job.job_title,
+            "status": job.status.value if hasattr(job.status, 'value') else job.status,
+            "date_applied": job.date_applied.isoformat() if job.date_applied else None,
+            "notes": job.notes,
+            "email_thread_link": job.email_thread_link
+        }) + "\n" for job in rows)
+
+async def _gzip_chunks(chunks):
+    # wbits=31 writes a gzip header, so the output is a valid .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def _utf8_chunks(chunks):
+    async for chunk in chunks:
+        yield chunk.encode('utf-8')
+
+EXPORT_FORMATS = {
+    "csv": (_csv_chunks, "text/csv"),
+    "ndjson": (_ndjson_chunks, "application/x-ndjson"),
+}
+
+@router.get("/export")
+async def export_jobs(format: str = "csv", gzip: bool = False, current_user: User = Depends(get_current_user)):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    make_chunks, media_type = EXPORT_FORMATS[format]
+
+    chunks = make_chunks(current_user.id)
+    filename = f"job_applications.{format}"
+    if gzip:
+        chunks = _gzip_chunks(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+    else:
+        chunks = _utf8_chunks(chunks)
+
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=job_applications.csv"}
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, Response
+from sqlalchemy import and_, or_, select, tuple_, delete as sql_delete, insert as sql_insert, update as sql_update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-from ..database import get_db
+from ..database import get_async_db
 from ..models import JobApplication, JobStatus, User
 from ..auth import get_current_user
+from ..gmail_service import thread_id_from_link
+from ..analytics_service import RollupDelta, record_job_changes
+import base64
+from contextlib import asynccontextmanager
+import hashlib
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
@@ -26,66 +33,293 @@ class JobUpdate(BaseModel):
     email_thread_link: Optional[str] = None
     date_applied: Optional[datetime] = None
 
+class JobBatchUpdate(JobUpdate):
+    id: int
+
+class JobBatch(BaseModel):
+    create: List[JobCreate] = []
+    update: List[JobBatchUpdate] = []
+    delete: List[int] = []
+
+# Max number of creates, updates and deletes in one batch request
+MAX_BATCH_ITEMS = 500
+
+DUPLICATE_DETAIL = "Job application for this company and title already exists."
+
+def _create_values(job: JobCreate, user_id: int):
+    return {
+        "user_id": user_id,
+        "company_name": job.company_name,
+        "job_title": job.job_title,
+        "status": job.status,
+        "notes": job.notes,
+        "email_thread_link": job.email_thread_link,
+        "thread_id": thread_id_from_link(job.email_thread_link),
+        "date_applied": job.date_applied or datetime.utcnow(),
+    }
+
+def _update_values(update: JobUpdate):
+    # Only the fields that were given; empty strings don't clear names or titles
+    values = {}
+    if update.status:
+        values["status"] = update.status
+        # Later scans of older emails won't undo a manual status change
+        values["status_updated_at"] = datetime.utcnow()
+    if update.notes is not None:
+        values["notes"] = update.notes
+    if update.company_name:
+        values["company_name"] = update.company_name
+    if update.job_title:
+        values["job_title"] = update.job_title
+    if update.email_thread_link is not None:
+        values["email_thread_link"] = update.email_thread_link
+        values["thread_id"] = thread_id_from_link(update.email_thread_link)
+    if update.date_applied:
+        values["date_applied"] = update.date_applied
+    return values
+
+# Fields that can be requested with ?fields=
+JOB_FIELDS = [column.name for column in JobApplication.__table__.columns]
+
+def _encode_cursor(job):
+    date_applied = job.date_applied.isoformat() if job.date_applied else ""
+    return base64.urlsafe_b64encode(f"{date_applied}|{job.id}".encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        date_applied, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date_applied), int(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/")
-def get_jobs(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(JobApplication).filter(JobApplication.user_id == current_user.id).order_by(JobApplication.date_applied.desc()).all()
+async def get_jobs(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Newest first. With ?limit= the next page's cursor is returned in the
+    X-Next-Cursor header; ?fields=a,b limits the columns returned.
+    """
+    # The ETag changes whenever the user's jobs do, so an unchanged board is a 304
+    version = await db.scalar(select(User.jobs_version).where(User.id == current_user.id)) or 0
+    params = hashlib.sha1(str(request.query_params).encode()).hexdigest()[:12]
+    etag = f'"{current_user.id}-{version}-{params}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in JOB_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        # id and date_applied are always needed for the cursor
+        names = list(dict.fromkeys(["id", "date_applied", *names]))
+        stmt = select(*[getattr(JobApplication, name) for name in names])
+    else:
+        stmt = select(JobApplication)
+
+    stmt = stmt.where(JobApplication.user_id == current_user.id)
+    if cursor:
+        date_applied, job_id = _decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            JobApplication.date_applied < date_applied,
+            and_(JobApplication.date_applied == date_applied, JobApplication.id < job_id)
+        ))
+    stmt = stmt.order_by(JobApplication.date_applied.desc(), JobApplication.id.desc())
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        stmt = stmt.limit(limit + 1)
+
+    result = await db.execute(stmt)
+    jobs = result.all() if fields else result.scalars().all()
+    if limit is not None and len(jobs) > limit:
+        jobs = jobs[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(jobs[-1])
+
+    if fields:
+        return [job._asdict() for job in jobs]
+    return jobs
+
+async def _get_user_job(db: AsyncSession, job_id: int, user_id: int):
+    job = await db.scalar(select(JobApplication).where(JobApplication.id == job_id, JobApplication.user_id == user_id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@asynccontextmanager
+async def _duplicate_guard(db: AsyncSession):
+    # A create or rename that collides with another role fails when it is flushed,
+    # which may be on a later statement rather than the commit
+    try:
+        yield
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=DUPLICATE_DETAIL)
+
+async def _commit_or_duplicate(db: AsyncSession):
+    async with _duplicate_guard(db):
+        await db.commit()
 
 @router.post("/")
-def create_job(job: JobCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_job(job: JobCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     user_id = current_user.id
 
     # Check for duplicates
-    existing_job = db.query(JobApplication).filter(
+    existing_job = await db.scalar(select(JobApplication.id).where(
         JobApplication.company_name == job.company_name,
         JobApplication.job_title == job.job_title,
         JobApplication.user_id == user_id
-    ).first()
+    ))
 
     if existing_job:
-        raise HTTPException(status_code=400, detail="Job application for this company and title already exists.") 
+        raise HTTPException(status_code=400, detail=DUPLICATE_DETAIL)
     
-    new_job = JobApplication(
-        user_id=user_id,
-        company_name=job.company_name,
-        job_title=job.job_title,
-        status=job.status,
-        notes=job.notes,
-        email_thread_link=job.email_thread_link,
-        date_applied=job.date_applied or datetime.utcnow()
-    )
+    new_job = JobApplication(**_create_values(job, user_id))
     db.add(new_job)
-    db.commit()
-    db.refresh(new_job)
+    delta = RollupDelta()
+    delta.add(new_job.status, new_job.date_applied)
+    await db.run_sync(record_job_changes, user_id, delta)
+    await _commit_or_duplicate(db)
+    await db.refresh(new_job)
     return new_job
 
 @router.put("/{job_id}")
-def update_job_status(job_id: int, update: JobUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    job = db.query(JobApplication).filter(JobApplication.id == job_id, JobApplication.user_id == current_user.id).first()
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
+async def update_job_status(job_id: int, update: JobUpdate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    job = await _get_user_job(db, job_id, current_user.id)
     
-    if update.status:
-        job.status = update.status
-    if update.notes is not None:
-        job.notes = update.notes
-    if update.company_name:
-        job.company_name = update.company_name
-    if update.job_title:
-        job.job_title = update.job_title
-    if update.email_thread_link is not None:
-        job.email_thread_link = update.email_thread_link
-    if update.date_applied:
-        job.date_applied = update.date_applied
-        
-    db.commit()
-    db.refresh(job)
+    delta = RollupDelta()
+    delta.remove(job.status, job.date_applied)
+
+    for field, value in _update_values(update).items():
+        setattr(job, field, value)
+
+    delta.add(job.status, job.date_applied)
+    async with _duplicate_guard(db):
+        await db.run_sync(record_job_changes, current_user.id, delta)
+        await db.commit()
+    await db.refresh(job)
     return job
 
 @router.delete("/{job_id}")
-def delete_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    job = db.query(JobApplication).filter(JobApplication.id == job_id, JobApplication.user_id == current_user.id).first()
-    if not job:
-         raise HTTPException(status_code=404, detail="Job not found")
-    db.delete(job)
-    db.commit()
+async def delete_job(job_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    job = await _get_user_job(db, job_id, current_user.id)
+    delta = RollupDelta()
+    delta.remove(job.status, job.date_applied)
+    await db.run_sync(record_job_changes, current_user.id, delta)
+    await db.delete(job)
+    await db.commit()
     return {"message": "Job deleted"}
+
+@router.post("/batch")
+async def batch_jobs(batch: JobBatch, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """
+    Apply creates, partial updates and deletes in one transaction.
+    Returns a result per item; items that can't be applied are reported and skipped.
+    """
+    user_id = current_user.id
+    if len(batch.create) + len(batch.update) + len(batch.delete) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+
+    delta = RollupDelta()
+    results = {"created": [], "updated": [], "deleted": []}
+
+    # Current state of every job this batch touches, in one query
+    target_ids = {item.id for item in batch.update} | set(batch.delete)
+    current = {
+        job_id: {"status": status, "date_applied": date_applied, "key": (company, title)}
+        for job_id, status, date_applied, company, title in await db.execute(select(
+            JobApplication.id, JobApplication.status, JobApplication.date_applied,
+            JobApplication.company_name, JobApplication.job_title
+        ).where(JobApplication.user_id == user_id, JobApplication.id.in_(target_ids)))
+    } if target_ids else {}
+
+    # 1. Creates: skip roles that already exist (in the DB or earlier in the batch)
+    keys = {(job.company_name, job.job_title) for job in batch.create}
+    taken = {tuple(row) for row in await db.execute(select(JobApplication.company_name, JobApplication.job_title).where(
+        JobApplication.user_id == user_id,
+        tuple_(JobApplication.company_name, JobApplication.job_title).in_(keys)
+    ))} if keys else set()
+    # Which job holds each role this batch creates or renames to, kept current as items apply
+    renamed = {
+        (item.company_name or current[item.id]["key"][0], item.job_title or current[item.id]["key"][1])
+        for item in batch.update if item.id in current and (item.company_name or item.job_title)
+    }
+    owners = {state["key"]: job_id for job_id, state in current.items()}
+    if renamed:
+        owners.update({(company, title): job_id for job_id, company, title in await db.execute(select(
+            JobApplication.id, JobApplication.company_name, JobApplication.job_title
+        ).where(
+            JobApplication.user_id == user_id,
+            tuple_(JobApplication.company_name, JobApplication.job_title).in_(renamed)
+        ))})
+    taken |= owners.keys()
+
+    rows, row_indexes = [], []
+    for index, job in enumerate(batch.create):
+        key = (job.company_name, job.job_title)
+        if key in taken:
+            results["created"].append({"index": index, "status": "duplicate", "detail": DUPLICATE_DETAIL})
+            continue
+        taken.add(key)
+        rows.append(_create_values(job, user_id))
+        row_indexes.append(index)
+        delta.add(job.status, rows[-1]["date_applied"])
+    if rows:
+        ids = (await db.scalars(
+            sql_insert(JobApplication).returning(JobApplication.id, sort_by_parameter_order=True), rows
+        )).all()
+        for index, job_id, row in zip(row_indexes, ids, rows):
+            owners[(row["company_name"], row["job_title"])] = job_id
+            results["created"].append({"index": index, "id": job_id, "status": "created"})
+        results["created"].sort(key=lambda result: result["index"])
+
+    # 2. Updates: one executemany UPDATE by primary key
+    params = []
+    for index, item in enumerate(batch.update):
+        if item.id not in current:
+            results["updated"].append({"index": index, "id": item.id, "status": "not_found"})
+            continue
+        values = _update_values(item)
+        state = current[item.id]
+        key = (values.get("company_name", state["key"][0]), values.get("job_title", state["key"][1]))
+        if owners.get(key, item.id) != item.id:
+            results["updated"].append({"index": index, "id": item.id, "status": "duplicate", "detail": DUPLICATE_DETAIL})
+            continue
+        owners.pop(state["key"], None)
+        owners[key] = item.id
+        state["key"] = key
+        delta.remove(state["status"], state["date_applied"])
+        state.update({k: v for k, v in values.items() if k in state})
+        delta.add(state["status"], state["date_applied"])
+        if values:
+            params.append({"id": item.id, **values})
+        results["updated"].append({"index": index, "id": item.id, "status": "updated"})
+    if params:
+        # Rows are updated in item order, so a role freed earlier in the batch can be reused
+        async with _duplicate_guard(db):
+            await db.execute(sql_update(JobApplication), params)
+
+    # 3. Deletes: a single DELETE ... WHERE id IN
+    delete_ids = [job_id for job_id in dict.fromkeys(batch.delete) if job_id in current]
+    for index, job_id in enumerate(batch.delete):
+        results["deleted"].append({"index": index, "id": job_id, "status": "deleted" if job_id in current else "not_found"})
+    if delete_ids:
+        for job_id in delete_ids:
+            state = current.pop(job_id)
+            delta.remove(state["status"], state["date_applied"])
+        await db.execute(sql_delete(JobApplication).where(
+            JobApplication.user_id == user_id, JobApplication.id.in_(delete_ids)
+        ))
+
+    await db.run_sync(record_job_changes, user_id, delta)
+    # Collisions were reported per item above; this only catches concurrent writes
+    await _commit_or_duplicate(db)
+    return results
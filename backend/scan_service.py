@@ -0,0 +1,690 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from .database import SessionLocal, dialect_insert
+from .models import JobApplication, JobStatus, User, ScanJob, ScanStatus
+from .gmail_service import thread_link
+from .gmail_async import GmailError, iter_blocking, run, stream_emails
+from .llm_service import LLM_MAX_CONCURRENCY, collect_results, submit_job_applications
+from .classification_cache import get_cached_results, get_cached_message_ids, store_results
+from .prefilter import filter_candidates, train_model, COUNTERS as PREFILTER_COUNTERS
+from .ats_extractors import extract as extract_ats, hit_rates as ats_hit_rates
+from .email_preprocessor import prepare_emails, raw_chars, thread_context, average_saved, COUNTERS as PREPROCESS_COUNTERS
+from .token_cache import invalidate_token
+from .analytics_service import RollupDelta, record_job_changes
+from .ignore_rules import IgnoreMatcher, get_rules, split_sender
+
+# Scans run in a background thread pool inside each API worker
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "2"))
+# A running scan that hasn't reported progress for this long is considered dead
+SCAN_STALE_SECONDS = int(os.getenv("SCAN_STALE_SECONDS", "600"))
+# Max number of email batches buffered between pipeline stages
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "2"))
+# Max number of chunks with Gemini calls queued or in flight at once
+SCAN_CLASSIFY_AHEAD = int(os.getenv("SCAN_CLASSIFY_AHEAD", "3"))
+
+_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+
+ACTIVE_STATUSES = (ScanStatus.PENDING, ScanStatus.RUNNING)
+
+class ScanCancelled(Exception):
+    pass
+
+class ScanProgress:
+    """
+    Writes scan counters to the ScanJob row and picks up cancel requests.
+
+    Counters can be bumped from any pipeline stage; only the thread that owns
+    the scan calls checkpoint() to save them.
+    """
+
+    # Min seconds between progress writes, so big scans don't hammer the DB
+    MIN_INTERVAL = 1.0
+
+    def __init__(self, scan_id):
+        self.scan_id = scan_id
+        self.counts = {"fetched": 0, "classified": 0, "persisted": 0}
+        self._lock = threading.Lock()
+        self._db = SessionLocal()
+        self._last_write = 0.0
+
+    def add(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def set(self, key, n):
+        with self._lock:
+            self.counts[key] = n
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def checkpoint(self, force=True):
+        """Save counters and raise ScanCancelled if a cancel was requested."""
+        now = time.monotonic()
+        if not force and now - self._last_write < self.MIN_INTERVAL:
+            return
+        self._last_write = now
+
+        job = self._db.get(ScanJob, self.scan_id)
+        for key, value in self._snapshot().items():
+            setattr(job, key, value)
+        job.updated_at = datetime.datetime.utcnow()
+        cancel_requested = job.cancel_requested
+        self._db.commit()
+        if cancel_requested:
+            raise ScanCancelled()
+
+    def set_status(self, status, message=None, result=None):
+        job = self._db.get(ScanJob, self.scan_id)
+        for key, value in self._snapshot().items():
+            setattr(job, key, value)
+        job.status = status
+        job.updated_at = datetime.datetime.utcnow()
+        if message is not None:
+            job.message = message
+        if result is not None:
+            job.result = json.dumps(result)
+        if status not in ACTIVE_STATUSES:
+            job.finished_at = job.updated_at
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+# --- Pipeline plumbing ---
+# fetch (Gmail, async) -> classify (cache, pre-filter, LLM) -> persist (DB),
+# each stage in its own thread with bounded queues in between.
+
+_DONE = object()
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+def _put(q, item, stop):
+    # Block while the queue is full, but give up once the pipeline is stopping
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop=None, on_idle=None):
+    while True:
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            if on_idle:
+                on_idle()
+            if stop is not None and stop.is_set():
+                return _DONE
+
+def _fetch_stage(batches, out_q, stop):
+    try:
+        for batch in batches:
+            if stop.is_set():
+                return
+            if not batch:
+                continue
+            if not _put(out_q, batch, stop):
+                return
+        _put(out_q, _DONE, stop)
+    except Exception as e:
+        _put(out_q, _StageError(e), stop)
+    finally:
+        # Stops any Gmail batches still queued when the scan ends early
+        batches.close()
+
+def _select_for_download(db: Session, user_id, metas, ignore, known_threads, model, progress, state):
+    """
+    Decide from headers alone which messages are worth downloading in full.
+    Runs inside the fetch stage, between the metadata and full-body batches.
+    """
+    progress.add("fetched", len(metas))
+
+    # 1. Filter out ignored senders
+    candidates = []
+    for meta in metas:
+        # Check ignore list
+        sender = meta.get('sender', '')
+        if ignore and ignore.matches(sender):
+           print(f"Skipping email from ignored sender: {sender}")
+           continue
+
+        candidates.append(meta)
+
+    cached_ids = get_cached_message_ids(db, user_id, [meta['id'] for meta in candidates])
+
+    # 2. In threads already on the board, only replies newer than the role's
+    # last status change can move it; the rest were seen on an earlier scan
+    unseen = []
+    for meta in candidates:
+        thread_id = meta.get('thread_id')
+        if thread_id and thread_id in known_threads:
+            status_at = known_threads[thread_id]
+            sent_at = _parse_date(meta.get('date'))
+            if meta['id'] in cached_ids or not sent_at or (status_at and sent_at <= status_at):
+                print(f"Skipping already scanned message {meta['id']} in thread {thread_id}")
+                continue
+        unseen.append(meta)
+    candidates = unseen
+
+    # Drop obvious non-candidates before paying for a download and a Gemini call.
+    # Messages classified on a previous scan skip the pre-filter; the cache decides.
+    uncached = [meta for meta in candidates if meta['id'] not in cached_ids]
+    kept, dropped, prefilter_stats = filter_candidates(uncached, model=model)
+    print(f"Pre-filter dropped {prefilter_stats['dropped']} of {prefilter_stats['scored']} uncached emails")
+    state["prefilter"]["scored"] += prefilter_stats["scored"]
+    state["prefilter"]["dropped"] += prefilter_stats["dropped"]
+    state["prefilter"]["threshold"] = prefilter_stats["threshold"]
+
+    selected_ids = cached_ids | {meta['id'] for meta in kept}
+    selected = [meta for meta in candidates if meta['id'] in selected_ids]
+    # Skipped messages are done; they never reach the classify stage
+    progress.add("classified", len(metas) - len(selected))
+    return selected
+
+class _ClassifyChunk:
+    """One chunk between _start_classify and _finish_classify."""
+
+    def __init__(self, candidates, extracted, cached, misses, futures):
+        self.candidates = candidates
+        self.extracted = extracted
+        self.cached = cached
+        self.misses = misses
+        self.futures = futures
+
+def _start_classify(db: Session, user_id, candidates, llm, progress, state):
+    """
+    Classify what a chunk of downloaded emails can without an LLM and queue the
+    rest on the shared `llm` executor. Emails are classified one per thread.
+    """
+    # Threads are fetched within one batch, so each is collapsed here in full
+    collapsed = _collapse_threads(candidates)
+    state["threads"]["messages"] += len(candidates)
+    state["threads"]["threads"] += len(collapsed)
+    # Folded-in messages are done; they don't get a classification of their own
+    progress.add("classified", len(candidates) - len(collapsed))
+    candidates = collapsed
+
+    # Known ATS templates are parsed right here, without the cache or an LLM call
+    extracted = {}
+    for msg in candidates:
+        result = extract_ats(msg)
+        if result:
+            extracted[msg['id']] = result
+    state["ats"]["matched"] += len(extracted)
+    progress.add("classified", len(extracted))
+    print(f"ATS templates matched {len(extracted)} of {len(candidates)} emails")
+
+    # 2. Classify the rest concurrently (results come back in message order)
+    # Subject and cleaned-up body, cut down to EMAIL_TEXT_BUDGET characters
+    # Emails are packed into batched prompts (see LLM_BATCH_SIZE)
+    texts, preprocess_stats = prepare_emails([msg for msg in candidates if msg['id'] not in extracted])
+    for key, n in preprocess_stats.items():
+        state["preprocess"][key] += n
+
+    # Skip the LLM for emails classified on a previous scan (including nulls)
+    cached = get_cached_results(db, user_id, texts)
+    print(f"Classification cache: {len(cached)} hits, {len(texts) - len(cached)} misses")
+    misses = [(message_id, text) for message_id, text in texts if message_id not in cached]
+    progress.add("classified", len(cached))
+
+    def on_done(future):
+        if not future.cancelled():
+            progress.add("classified", len(future.result()))
+
+    futures = submit_job_applications(llm, misses)
+    for future in futures:
+        future.add_done_callback(on_done)
+    return _ClassifyChunk(candidates, extracted, cached, misses, futures)
+
+def _finish_classify(db: Session, user_id, chunk, state):
+    """Cache a chunk's finished LLM results. Returns [(msg, parsed_data)]."""
+    fresh = dict(zip(
+        [message_id for message_id, _ in chunk.misses],
+        collect_results(chunk.misses, [future.result() for future in chunk.futures], failed_ids=state["failed_ids"])
+    ))
+
+    # Cache everything that was actually answered; failures are retried next scan
+    by_id = {msg['id']: msg for msg in chunk.candidates}
+    store_results(db, user_id, [
+        (message_id, text, fresh[message_id], by_id[message_id]['subject'], by_id[message_id]['sender'])
+        for message_id, text in chunk.misses if message_id not in state["failed_ids"]
+    ])
+    db.commit()
+
+    results = {**fresh, **chunk.cached, **chunk.extracted}
+    return [(msg, results.get(msg['id'])) for msg in chunk.candidates]
+
+def _classify_stage(user_id, in_q, out_q, stop, progress, state):
+    # Sessions aren't thread safe, so this stage gets its own
+    db = SessionLocal()
+    # Gemini calls of every chunk share one pool, so the next chunk's prompts
+    # start while the previous chunk's slowest ones are still in flight
+    llm = ThreadPoolExecutor(max_workers=max(1, LLM_MAX_CONCURRENCY))
+    pending = deque()
+    done = False
+    try:
+        while not done or pending:
+            # Finished chunks are handed on in order
+            if pending and all(future.done() for future in pending[0].futures):
+                if not _put(out_q, _finish_classify(db, user_id, pending.popleft(), state), stop):
+                    return
+                continue
+            if done or len(pending) >= SCAN_CLASSIFY_AHEAD:
+                wait(pending[0].futures, timeout=0.5)
+                if stop.is_set():
+                    return
+                continue
+
+            try:
+                batch = in_q.get(timeout=0.05 if pending else 0.5)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if batch is _DONE:
+                done = True
+            elif isinstance(batch, _StageError):
+                _put(out_q, batch, stop)
+                return
+            else:
+                pending.append(_start_classify(db, user_id, batch, llm, progress, state))
+        _put(out_q, _DONE, stop)
+    except Exception as e:
+        _put(out_q, _StageError(e), stop)
+    finally:
+        # Prompts not started yet are dropped when the scan stops early
+        llm.shutdown(wait=True, cancel_futures=True)
+        db.close()
+
+def _parse_date(msg_date):
+    """Naive UTC datetime of an RFC 2822 Date header, or None."""
+    try:
+        if msg_date:
+            parsed_time = parsedate_to_datetime(msg_date)
+            if parsed_time.tzinfo is not None:
+                parsed_time = parsed_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            return parsed_time
+    except Exception as e:
+        print(f"Error parsing date {msg_date}: {e}")
+    return None
+
+def _collapse_threads(emails):
+    """
+    One email per thread, so a thread costs one classification. The newest
+    message is kept with a summary of the earlier ones in 'thread_context';
+    its 'date' becomes the thread's earliest date, used as the applied date.
+    """
+    threads = {}
+    for msg in emails:
+        threads.setdefault(msg.get('thread_id') or msg['id'], []).append(msg)
+
+    collapsed = []
+    for messages in threads.values():
+        if len(messages) == 1:
+            collapsed.append(messages[0])
+            continue
+        # Oldest first; undated messages keep their place at the front
+        messages = sorted(messages, key=lambda m: _parse_date(m.get('date')) or datetime.datetime.min)
+        newest = messages[-1]
+        collapsed.append({
+            **newest,
+            "date": next((m['date'] for m in messages if _parse_date(m.get('date'))), newest.get('date')),
+            "latest_date": newest.get('date'),
+            "thread_context": thread_context(messages[:-1]),
+            "thread_chars": sum(raw_chars(m) for m in messages[:-1]),
+        })
+    return collapsed
+
+def _job_row(user: User, msg, parsed_data):
+    """Build the job_applications row for one classified email."""
+    company = parsed_data.get('company_name', 'Unknown Company')
+    title = parsed_data.get('job_title', 'Unknown Role')
+
+    # Parse Date from Email Metadata (More reliable than LLM)
+    print(f"DEBUG: Parsing date for {company}: '{msg.get('date')}'")
+    date_applied = _parse_date(msg.get('date')) or datetime.datetime.utcnow()
+
+    try:
+        status_str = parsed_data.get('status', 'APPLIED')
+        if status_str not in JobStatus.__members__:
+            status_str = 'APPLIED'
+        status_enum = JobStatus(status_str)
+    except:
+        status_enum = JobStatus.APPLIED
+
+    sender_address, sender_domain = split_sender(msg.get('sender'))
+
+    return {
+        "user_id": user.id,
+        "company_name": company,
+        "job_title": title,
+        "status": status_enum,
+        "date_applied": date_applied,
+        "sender_email": msg.get('sender'),
+        "sender_address": sender_address,
+        "sender_domain": sender_domain,
+        "notes": parsed_data.get('notes'),
+        "thread_id": msg['thread_id'],
+        "email_thread_link": thread_link(msg['thread_id']),
+        # The status comes from the newest email of the thread
+        "status_updated_at": _parse_date(msg.get('latest_date')) or date_applied,
+    }
+
+def _merge_role(old, new):
+    """
+    Combine two (status, date_applied, status_updated_at) states of one role:
+    the earliest applied date, and the status of whichever email is newer.
+    """
+    old_status, old_date, old_at = old
+    new_status, new_date, new_at = new
+    dates = [d for d in (old_date, new_date) if d]
+    date = min(dates) if dates else None
+    old_at = old_at or old_date
+    if old_at is None or (new_at is not None and new_at >= old_at):
+        return new_status, date, new_at
+    return old_status, date, old_at
+
+def _stored_roles(db: Session, user_id, keys):
+    """
+    The stored (status, date_applied, status_updated_at) of the user's roles
+    among `keys`, locked on Postgres until the transaction ends so board edits
+    can't change them between this read and the upsert.
+    """
+    rows = db.query(
+        JobApplication.company_name, JobApplication.job_title,
+        JobApplication.status, JobApplication.date_applied, JobApplication.status_updated_at
+    ).filter(
+        JobApplication.user_id == user_id,
+        JobApplication.company_name.in_({company for company, _ in keys})
+    ).with_for_update()
+    return {(company, title): (status, date_applied, status_updated_at)
+            for company, title, status, date_applied, status_updated_at in rows if (company, title) in keys}
+
+def _upsert_jobs(db: Session, user: User, rows):
+    """
+    Insert job rows in one statement. A role the user already has keeps its
+    earliest applied date and takes the status and thread of the newer email.
+    Returns how many rows refreshed an existing role.
+    """
+    if not rows:
+        return 0
+    # A key may only appear once per statement, so rows for one role are merged by date first
+    merged = {}
+    for row in sorted(rows, key=lambda r: r["status_updated_at"]):
+        key = (row["company_name"], row["job_title"])
+        if key in merged:
+            row = {**row, "date_applied": min(merged[key]["date_applied"], row["date_applied"])}
+        merged[key] = row
+    rows = list(merged.values())
+    # Read in this transaction, not at scan start: the board may have changed since
+    stored = _stored_roles(db, user.id, set(merged))
+
+    insert = dialect_insert(db)
+    stmt = insert(JobApplication).values(rows)
+    excluded = stmt.excluded
+    # Same rules as _merge_role, against the stored row
+    stored_at = func.coalesce(JobApplication.status_updated_at, JobApplication.date_applied, excluded.status_updated_at)
+    newer = excluded.status_updated_at >= stored_at
+
+    def if_newer(column):
+        return case((newer, getattr(excluded, column)), else_=getattr(JobApplication, column))
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "company_name", "job_title"],
+        set_={
+            "date_applied": case(
+                (excluded.date_applied < JobApplication.date_applied, excluded.date_applied),
+                else_=func.coalesce(JobApplication.date_applied, excluded.date_applied),
+            ),
+            "status": if_newer("status"),
+            "status_updated_at": if_newer("status_updated_at"),
+            "email_thread_link": if_newer("email_thread_link"),
+            "thread_id": if_newer("thread_id"),
+        },
+    )
+    db.execute(stmt)
+
+    # Keep the analytics rollup in step, in the same transaction
+    delta = RollupDelta()
+    updated = 0
+    for row in rows:
+        key = (row["company_name"], row["job_title"])
+        state = (row["status"], row["date_applied"], row["status_updated_at"])
+        if key in stored:
+            old = stored[key]
+            delta.remove(old[0], old[1])
+            state = _merge_role(old, state)
+            updated += 1
+        delta.add(state[0], state[1])
+    record_job_changes(db, user.id, delta)
+    return updated
+
+def run_scan(db: Session, token, user: User, full: bool, progress: ScanProgress):
+    """Fetch, classify and persist job emails for a user. Returns the scan summary."""
+    # Only pull messages added since the last scan unless a full rescan is requested
+    # Increased limit for better results - Batch 500
+    start_history_id = None if full else user.gmail_history_id
+
+    processed = 0
+    updated = 0
+    debug_logs = []
+    state = {"failed_ids": set(), "prefilter": {"scored": 0, "dropped": 0}, "threads": {"messages": 0, "threads": 0}, "ats": {"matched": 0}, "preprocess": {"emails": 0, "chars_in": 0, "chars_out": 0}, "gmail": {"retried": 0, "lost": 0}}
+
+    # Ignore rules, compiled once for the whole scan
+    ignore = IgnoreMatcher(get_rules(db, user.id))
+
+    # Everything the header filter needs is loaded once up front
+    # Thread id -> when the role it belongs to last changed status
+    known_threads = dict(
+        db.query(
+            JobApplication.thread_id,
+            func.max(func.coalesce(JobApplication.status_updated_at, JobApplication.date_applied)),
+        ).filter(
+            JobApplication.user_id == user.id, JobApplication.thread_id.isnot(None)
+        ).group_by(JobApplication.thread_id)
+    )
+    model = train_model(db, user.id)
+
+    # The fetch stage runs the header filter, so it needs its own session too
+    select_db = SessionLocal()
+    def select(metas):
+        return _select_for_download(select_db, user.id, metas, ignore, known_threads, model, progress, state)
+
+    try:
+        batches, history_id = run(stream_emails(token, start_history_id=start_history_id, max_results=500, select=select, stats=state["gmail"], exclude_senders=ignore.senders()))
+        # Gmail I/O stays on the shared background loop; the fetch stage just waits on it
+        batches = iter_blocking(batches)
+    except Exception:
+        select_db.close()
+        raise
+
+    stop = threading.Event()
+    fetched_q = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    classified_q = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stages = [
+        threading.Thread(target=_fetch_stage, args=(batches, fetched_q, stop), daemon=True),
+        threading.Thread(target=_classify_stage, args=(user.id, fetched_q, classified_q, stop, progress, state), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    try:
+        # 3. Persist each classified chunk as it arrives and commit it right away
+        while True:
+            chunk = _get(classified_q, on_idle=lambda: progress.checkpoint(force=False))
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, _StageError):
+                raise chunk.error
+
+            rows = []
+            for msg, parsed_data in chunk:
+                log_entry = f"Subject: {msg['subject']} (Body Len: {len(msg['body'])}) -> Parsed: {parsed_data}"
+                print(log_entry)
+                debug_logs.append(log_entry)
+
+                if parsed_data:
+                    try:
+                        rows.append(_job_row(user, msg, parsed_data))
+                    except Exception as inner_e:
+                        print(f"Error processing single email {msg.get('subject')}: {inner_e}")
+                        debug_logs.append(f"Error persisting: {inner_e}")
+
+            updated += _upsert_jobs(db, user, rows)
+            db.commit()
+            processed += len(rows) # Count as processed for feedback
+            progress.add("persisted", len(rows))
+            progress.checkpoint(force=False)
+
+    except ScanCancelled:
+        raise
+    except Exception as e:
+        print(f"CRITICAL SCAN ERROR: {e}")
+        debug_logs.append(f"CRITICAL ERROR: {e}")
+        # Build message even if failed partway
+        return {
+             "message": f"Scan interrupted. Scanned {progress.counts['fetched']} emails, found {processed} so far. Error: {str(e)}",
+             "debug": debug_logs,
+             "interrupted": True
+        }
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+        select_db.close()
+
+    progress.checkpoint()
+
+    # Advance the sync cursor only when nothing needs to be retried on the next scan
+    failed_ids = state["failed_ids"]
+    lost = state["gmail"]["lost"]
+    if not failed_ids and not lost:
+        user.gmail_history_id = history_id
+    else:
+        print(f"{len(failed_ids)} emails failed to classify and {lost} could not be fetched, keeping sync cursor at {user.gmail_history_id}")
+
+    db.commit()
+    preprocess = state["preprocess"]
+    return {
+        "message": f"Scanned {progress.counts['fetched']} emails, found {processed} job applications.",
+        "debug": debug_logs,
+        # Found applications that refreshed a role already on the board
+        "updated": updated,
+        # How many emails the pre-filter kept away from the LLM
+        "prefilter": {**state["prefilter"], "dropped_since_startup": PREFILTER_COUNTERS["dropped"]},
+        # Emails classified, once per thread
+        "threads": state["threads"],
+        # Emails parsed by an ATS template instead of the LLM, and each template's hit rate
+        "ats": {**state["ats"], "extractors_since_startup": ats_hit_rates()},
+        # Characters the preprocessor kept out of the prompts
+        "preprocess": {
+            **preprocess,
+            "avg_chars_saved": average_saved(preprocess["emails"], preprocess["chars_in"] - preprocess["chars_out"]),
+            "avg_chars_saved_since_startup": average_saved(PREPROCESS_COUNTERS["emails"], PREPROCESS_COUNTERS["chars_saved"]),
+        },
+        # Gmail sub-requests that had to be retried, and messages lost after all retries
+        "gmail": state["gmail"]
+    }
+
+def _run_scan_job(scan_id, token):
+    db = SessionLocal()
+    progress = ScanProgress(scan_id)
+    try:
+        job = db.get(ScanJob, scan_id)
+        user = db.get(User, job.user_id)
+        progress.set_status(ScanStatus.RUNNING)
+        progress.checkpoint()
+
+        result = run_scan(db, token, user, job.full, progress)
+        progress.set_status(
+            ScanStatus.FAILED if result.get("interrupted") else ScanStatus.COMPLETED,
+            message=result["message"],
+            result={"debug": result["debug"], "prefilter": result.get("prefilter"),
+                    "threads": result.get("threads"), "ats": result.get("ats"), "preprocess": result.get("preprocess"), "gmail": result.get("gmail")}
+        )
+    except ScanCancelled:
+        db.rollback()
+        print(f"Scan {scan_id} cancelled")
+        progress.set_status(ScanStatus.CANCELLED, message="Scan cancelled.")
+    except Exception as e:
+        db.rollback()
+        print(f"Scan {scan_id} failed: {e}")
+        if isinstance(e, GmailError) and e.status == 401:
+            # Google no longer accepts this token; don't let the auth cache keep vouching for it
+            invalidate_token(db, token)
+        progress.set_status(ScanStatus.FAILED, message=f"Scan failed: {str(e)}")
+    finally:
+        progress.close()
+        db.close()
+
+def get_active_scan(db: Session, user_id):
+    """Return the user's pending/running scan, ignoring ones that stopped reporting."""
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=SCAN_STALE_SECONDS)
+    return db.query(ScanJob).filter(
+        ScanJob.user_id == user_id,
+        ScanJob.status.in_(ACTIVE_STATUSES),
+        ScanJob.updated_at >= stale_before
+    ).order_by(ScanJob.created_at.desc()).first()
+
+def fail_if_stale(db: Session, job: ScanJob):
+    """
+    Mark a pending/running scan that stopped reporting as failed, e.g. after its
+    worker died, so pollers see it end. Returns the job.
+    """
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=SCAN_STALE_SECONDS)
+    if job.status in ACTIVE_STATUSES and job.updated_at and job.updated_at < stale_before:
+        job.status = ScanStatus.FAILED
+        job.message = "Scan stopped responding. Please try again."
+        job.finished_at = datetime.datetime.utcnow()
+        db.commit()
+        db.refresh(job)
+    return job
+
+def start_scan(db: Session, user: User, token, full=False):
+    """Queue a background scan for the user, or return the one already running."""
+    active = get_active_scan(db, user.id)
+    if active:
+        return active
+
+    job = ScanJob(id=uuid.uuid4().hex, user_id=user.id, full=full, status=ScanStatus.PENDING)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    _executor.submit(_run_scan_job, job.id, token)
+    return job
+
+def serialize_scan(job: ScanJob):
+    result = json.loads(job.result) if job.result else {}
+    return {
+        "scan_id": job.id,
+        "status": job.status.value if hasattr(job.status, 'value') else job.status,
+        "fetched": job.fetched or 0,
+        "classified": job.classified or 0,
+        "persisted": job.persisted or 0,
+        "message": job.message,
+        "debug": result.get("debug", []),
+        "prefilter": result.get("prefilter"),
+        "threads": result.get("threads"),
+        "ats": result.get("ats"),
+        "preprocess": result.get("preprocess"),
+        "gmail": result.get("gmail"),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
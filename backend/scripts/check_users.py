@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from backend.models import User
 from backend.database import DATABASE_URL
+from backend.ignore_rules import format_rules, get_rules
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -12,7 +13,7 @@ def check_users():
         users = db.query(User).all()
         print(f"Total Users: {len(users)}")
         for u in users:
-            print(f"ID: {u.id}, Email: {u.email}, Ignored: '{u.ignored_emails}'")
+            print(f"ID: {u.id}, Email: {u.email}, Ignored: '{format_rules(get_rules(db, u.id))}'")
     finally:
         db.close()
 
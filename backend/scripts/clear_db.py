@@ -1,6 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from backend.models import Base, JobApplication
+from backend.models import Base, JobApplication, JobStatusRollup, JobWeekRollup
 from backend.database import DATABASE_URL
 
 engine = create_engine(DATABASE_URL)
@@ -10,6 +10,8 @@ def clear_data():
     db = SessionLocal()
     try:
         num_deleted = db.query(JobApplication).delete()
+        db.query(JobStatusRollup).delete()
+        db.query(JobWeekRollup).delete()
         db.commit()
         print(f"Successfully deleted {num_deleted} job applications.")
     except Exception as e:
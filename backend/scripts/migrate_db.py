@@ -0,0 +1,133 @@
+from sqlalchemy import bindparam, create_engine, inspect, text
+from backend.models import Base
+from backend.database import DATABASE_URL
+from backend.gmail_service import THREAD_LINK_PREFIX
+from backend.scripts.rebuild_rollups import rebuild_rollups
+from backend.ignore_rules import parse_rules, split_sender
+
+# Base.metadata.create_all only creates missing tables. This adds columns that
+# were introduced on existing tables after they were first created.
+
+engine = create_engine(DATABASE_URL)
+
+# Status progression, for merging duplicate rows
+STATUS_ORDER = {"APPLIED": 0, "INTERVIEWING": 1, "REJECTED": 2, "OFFER": 3}
+
+def add_missing_columns():
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                print(f"Adding column {table.name}.{column.name} ({col_type})")
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+def backfill_job_applications():
+    with engine.begin() as conn:
+        # thread_id used to live only inside email_thread_link
+        conn.execute(text(
+            "UPDATE job_applications SET thread_id = substr(email_thread_link, :start) "
+            "WHERE thread_id IS NULL AND email_thread_link LIKE :prefix"
+        ), {"start": len(THREAD_LINK_PREFIX) + 1, "prefix": THREAD_LINK_PREFIX + "%"})
+
+        # Older scans could store the same role twice; merge them into the newest row
+        rows = conn.execute(text(
+            "SELECT j.id, j.user_id, j.company_name, j.job_title, j.status, j.date_applied, j.notes, j.status_updated_at "
+            "FROM job_applications j JOIN ("
+            "SELECT user_id, company_name, job_title FROM job_applications "
+            "GROUP BY user_id, company_name, job_title HAVING COUNT(*) > 1"
+            ") d ON j.user_id = d.user_id AND j.company_name = d.company_name AND j.job_title = d.job_title "
+            "ORDER BY j.id"
+        )).all()
+        groups = {}
+        for row in rows:
+            groups.setdefault((row.user_id, row.company_name, row.job_title), []).append(row)
+
+        removed = 0
+        for group in groups.values():
+            keep = group[-1]
+            dates = [row.date_applied for row in group if row.date_applied]
+            updated_at = [row.status_updated_at for row in group if row.status_updated_at]
+            notes = []
+            for row in group:
+                if row.notes and row.notes.strip() and row.notes not in notes:
+                    notes.append(row.notes)
+            conn.execute(text(
+                "UPDATE job_applications SET date_applied = :date_applied, status = :status, notes = :notes, "
+                "status_updated_at = :status_updated_at WHERE id = :id"
+            ), {
+                "id": keep.id,
+                "date_applied": min(dates) if dates else None,
+                # Nothing says which status was set last, so the furthest one along wins
+                "status": max((row.status for row in group), key=lambda status: STATUS_ORDER.get(status, -1)),
+                "notes": "\n\n".join(notes) or None,
+                "status_updated_at": max(updated_at) if updated_at else None,
+            })
+            conn.execute(text("DELETE FROM job_applications WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ), {"ids": [row.id for row in group[:-1]]})
+            removed += len(group) - 1
+        if removed:
+            print(f"Merged {removed} duplicate job applications")
+
+def backfill_senders_and_rules():
+    with engine.begin() as conn:
+        # Split sender_email into the address/domain columns ignore rules match on
+        rows = conn.execute(text(
+            "SELECT id, sender_email FROM job_applications "
+            "WHERE sender_address IS NULL AND sender_email IS NOT NULL"
+        )).all()
+        params = []
+        for job_id, sender in rows:
+            address, domain = split_sender(sender)
+            if address:
+                params.append({"id": job_id, "address": address, "domain": domain})
+        if params:
+            conn.execute(text(
+                "UPDATE job_applications SET sender_address = :address, sender_domain = :domain WHERE id = :id"
+            ), params)
+            print(f"Filled sender address for {len(params)} job applications")
+
+        # Copy the legacy comma separated ignore lists into ignore_rules
+        users = conn.execute(text(
+            "SELECT id, ignored_emails FROM users WHERE ignored_emails IS NOT NULL AND ignored_emails != '' "
+            "AND id NOT IN (SELECT user_id FROM ignore_rules)"
+        )).all()
+        for user_id, ignored_emails in users:
+            rules = [{"user_id": user_id, "kind": kind, "value": value} for kind, value in parse_rules(ignored_emails)]
+            if rules:
+                conn.execute(text(
+                    "INSERT INTO ignore_rules (user_id, kind, value) VALUES (:user_id, :kind, :value)"
+                ), rules)
+                print(f"Copied {len(rules)} ignore rules for user {user_id}")
+
+def purge_unowned_cache():
+    with engine.begin() as conn:
+        # Cache entries from before user_id can't be told apart across mailboxes; they are re-classified once
+        result = conn.execute(text("DELETE FROM classification_cache WHERE user_id IS NULL"))
+        if result.rowcount:
+            print(f"Removed {result.rowcount} classification cache entries without a user")
+        # Replaced by ix_classification_cache_user_lookup
+        conn.execute(text("DROP INDEX IF EXISTS ix_classification_cache_lookup"))
+
+def add_missing_indexes():
+    # create_all doesn't add indexes to tables that already exist
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+if __name__ == "__main__":
+    print("Migrating database...")
+    add_missing_columns()
+    backfill_job_applications()
+    backfill_senders_and_rules()
+    purge_unowned_cache()
+    add_missing_indexes()
+    rebuild_rollups()
+    print("Done.")
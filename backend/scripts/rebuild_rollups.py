@@ -0,0 +1,28 @@
+import sys
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import User
+from backend.database import DATABASE_URL
+from backend.analytics_service import rebuild_rollup
+
+# Recomputes the analytics rollup tables from job_applications.
+# Usage: python -m backend.scripts.rebuild_rollups [user_email ...]
+
+engine = create_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def rebuild_rollups(emails=None):
+    db = SessionLocal()
+    try:
+        query = db.query(User)
+        if emails:
+            query = query.filter(User.email.in_(emails))
+        for user in query.all():
+            rebuild_rollup(db, user.id)
+            db.commit()
+            print(f"Rebuilt analytics rollup for {user.email}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_rollups(sys.argv[1:])
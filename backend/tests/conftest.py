@@ -0,0 +1,138 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from backend import gmail_async
+from backend.main import app
+from backend.auth import get_current_user
+from backend.database import Base, get_async_db, get_db
+from backend.models import User
+
+class FakeGmail(BaseHTTPRequestHandler):
+    """Serves users/me/{profile,messages,messages/<id>,history} from the server's `messages` dict."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        path = url.path.split("/users/me/", 1)[1]
+        server.requests.append((path, params))
+
+        if self.headers.get("Authorization") != "Bearer good":
+            return self._send(401, {"error": {"message": "Invalid Credentials"}})
+        if path == "profile":
+            return self._send(200, {"emailAddress": "me@example.com", "historyId": "900"})
+        if path == "history":
+            if params["startHistoryId"] == ["1"]:
+                return self._send(404, {"error": {"message": "Requested entity was not found."}})
+            return self._send(200, {"historyId": "950", "history": server.history})
+        if path == "messages":
+            ids = sorted(server.messages)
+            if server.matching is not None:
+                ids = [i for i in ids if i in server.matching]
+            start = int(params.get("pageToken", ["0"])[0])
+            end = start + int(params["maxResults"][0])
+            page = {"messages": [{"id": i, "threadId": f"t{i}"} for i in ids[start:end]]}
+            if end < len(ids):
+                page["nextPageToken"] = str(end)
+            return self._send(200, page)
+
+        message_id = path.split("/")[1]
+        with server.lock:
+            server.failures[message_id] = server.failures.get(message_id, 0) - 1
+            if server.failures[message_id] >= 0:
+                return self._send(429, {"error": {"message": "rateLimitExceeded"}})
+        subject, body = server.messages[message_id]
+        message = {"id": message_id, "threadId": f"t{message_id}", "internalDate": "1704103200000",
+                   "payload": {"headers": [{"name": "Subject", "value": subject}], "mimeType": "text/plain"}}
+        if params["format"] == ["full"]:
+            message["payload"]["body"] = {"data": base64.urlsafe_b64encode(body.encode()).decode()}
+        self._send(200, message)
+
+@pytest.fixture
+def gmail(monkeypatch):
+    """A fake Gmail API server that only accepts the token "good"."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmail)
+    server.messages = {f"m{i}": (f"Subject {i}", f"Body {i}") for i in range(1, 6)}
+    server.history = [{"id": "901", "messagesAdded": [
+        {"message": {"id": "m2", "threadId": "t2", "labelIds": ["INBOX"]}},
+        {"message": {"id": "m9", "threadId": "t9", "labelIds": ["SENT"]}},
+    ]}]
+    # Ids the messages.list search matches; None matches everything
+    server.matching = None
+    server.requests = []
+    server.failures = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(gmail_async, "GMAIL_API_URL", f"http://127.0.0.1:{server.server_address[1]}/gmail/v1")
+    monkeypatch.setattr(gmail_async, "GMAIL_RETRY_BASE_DELAY", 0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def db_url(tmp_path):
+    """A SQLite file, so the app's sync and async sessions see the same data."""
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    yield url
+    engine.dispose()
+
+@pytest.fixture
+def db(db_url):
+    session = sessionmaker(bind=create_engine(db_url), expire_on_commit=False)()
+    yield session
+    session.close()
+
+@pytest.fixture
+def user(db):
+    user = User(email="me@example.com")
+    db.add(user)
+    db.commit()
+    return user
+
+@pytest.fixture
+def client(db_url):
+    """The app on the test database. Requests are not signed in; see `signed_in`."""
+    SessionLocal = sessionmaker(bind=create_engine(db_url), expire_on_commit=False)
+    AsyncSessionLocal = async_sessionmaker(create_async_engine(db_url.replace("sqlite://", "sqlite+aiosqlite://", 1)), expire_on_commit=False)
+
+    async def get_test_async_db():
+        async with AsyncSessionLocal() as session:
+            yield session
+
+    def get_test_db():
+        session = SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    app.dependency_overrides[get_db] = get_test_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def signed_in(client, user):
+    """Makes every `client` request as `user`."""
+    app.dependency_overrides[get_current_user] = lambda: user
+    return user
@@ -0,0 +1,56 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend.models import JobApplication, JobStatus, User
+from backend.routers import analytics
+
+pytestmark = pytest.mark.usefixtures("signed_in")
+
+@pytest.fixture(autouse=True)
+def jobs(db_url, db, user, monkeypatch):
+    other = User(email="other@example.com")
+    db.add(other)
+    db.commit()
+    db.add_all([
+        JobApplication(user_id=user.id, company_name=f"C{i}", job_title="Engineer", status=JobStatus.APPLIED,
+                       date_applied=datetime(2024, 1, i + 1), notes="Says \"hi\", twice" if i == 0 else None)
+        for i in range(5)
+    ])
+    db.add(JobApplication(user_id=other.id, company_name="Hidden", job_title="Engineer", date_applied=datetime(2024, 1, 1)))
+    db.commit()
+
+    # The export streams from its own session, not the request's
+    monkeypatch.setattr(analytics, "AsyncSessionLocal", async_sessionmaker(
+        create_async_engine(db_url.replace("sqlite://", "sqlite+aiosqlite://", 1)), expire_on_commit=False))
+    # Several partitions per export
+    monkeypatch.setattr(analytics, "EXPORT_BATCH_SIZE", 2)
+
+def test_csv_export_streams_only_the_users_rows(client):
+    response = client.get("/analytics/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "job_applications.csv" in response.headers["content-disposition"]
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["ID", "Company", "Job Title", "Status", "Date Applied", "Notes", "Email Link"]
+    assert [row[1] for row in rows[1:]] == ["C0", "C1", "C2", "C3", "C4"]
+    assert rows[1][3:6] == ["APPLIED", "2024-01-01", 'Says "hi", twice']
+
+    assert client.get("/analytics/export", params={"format": "xml"}).status_code == 400
+
+def test_ndjson_and_gzip_exports(client):
+    plain = client.get("/analytics/export", params={"format": "ndjson"})
+    assert plain.headers["content-type"].startswith("application/x-ndjson")
+    jobs = [json.loads(line) for line in plain.text.splitlines()]
+    assert [job["company_name"] for job in jobs] == ["C0", "C1", "C2", "C3", "C4"]
+    assert jobs[1]["date_applied"] == "2024-01-02T00:00:00" and jobs[1]["notes"] is None
+
+    for format, text in (("ndjson", plain.text), ("csv", client.get("/analytics/export").text)):
+        response = client.get("/analytics/export", params={"format": format, "gzip": True})
+        assert response.headers["content-type"] == "application/gzip"
+        assert f"job_applications.{format}.gz" in response.headers["content-disposition"]
+        assert gzip.decompress(response.content).decode() == text
@@ -0,0 +1,70 @@
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import JobApplication, JobStatus, User
+from backend.analytics_service import RollupDelta, apply_rollup, compute_stats, rebuild_rollup
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def test_rebuilt_stats_are_per_user_and_bucketed_by_monday():
+    db = _session()
+    me, other = User(email="me@example.com"), User(email="other@example.com")
+    db.add_all([me, other])
+    db.commit()
+
+    def job(user, title, status, date):
+        return JobApplication(user_id=user.id, company_name="Acme", job_title=title, status=status, date_applied=date)
+
+    db.add_all([
+        job(me, "A", JobStatus.APPLIED, datetime(2024, 1, 15, 9)),       # Monday
+        job(me, "B", JobStatus.INTERVIEWING, datetime(2024, 1, 21, 23)), # Sunday, same week
+        job(me, "C", JobStatus.OFFER, datetime(2024, 1, 24)),
+        job(me, "D", JobStatus.REJECTED, datetime(2023, 6, 1)),          # Outside the chart
+        job(other, "A", JobStatus.OFFER, datetime(2024, 1, 24)),
+    ])
+    db.commit()
+    rebuild_rollup(db, me.id)
+    rebuild_rollup(db, other.id)
+    db.commit()
+
+    stats = compute_stats(db, me.id, weeks=3, today=datetime(2024, 1, 25))
+
+    assert stats["summary"] == {"total": 4, "active": 2, "offers": 1, "response_rate": "75.0%"}
+    assert stats["funnel_counts"] == {"APPLIED": 1, "INTERVIEWING": 1, "REJECTED": 1, "OFFER": 1}
+    assert stats["weekly_activity"] == [
+        {"week": "2024-01-08", "count": 0},
+        {"week": "2024-01-15", "count": 2},
+        {"week": "2024-01-22", "count": 1},
+    ]
+
+def test_incremental_deltas_match_rebuild():
+    db = _session()
+    me = User(email="me@example.com")
+    db.add(me)
+    db.commit()
+
+    # Two applications, then one moves to a new status and week
+    delta = RollupDelta()
+    delta.add(JobStatus.APPLIED, datetime(2024, 1, 15))
+    delta.add(JobStatus.APPLIED, datetime(2024, 1, 16))
+    apply_rollup(db, me.id, delta)
+    delta = RollupDelta()
+    delta.remove(JobStatus.APPLIED, datetime(2024, 1, 16))
+    delta.add(JobStatus.OFFER, datetime(2024, 1, 23))
+    apply_rollup(db, me.id, delta)
+    db.commit()
+    incremental = compute_stats(db, me.id, weeks=2, today=datetime(2024, 1, 25))
+
+    db.add_all([
+        JobApplication(user_id=me.id, company_name="Acme", job_title="A", status=JobStatus.APPLIED, date_applied=datetime(2024, 1, 15)),
+        JobApplication(user_id=me.id, company_name="Acme", job_title="B", status=JobStatus.OFFER, date_applied=datetime(2024, 1, 23)),
+    ])
+    rebuild_rollup(db, me.id)
+    db.commit()
+
+    assert compute_stats(db, me.id, weeks=2, today=datetime(2024, 1, 25)) == incremental
+    assert incremental["summary"]["total"] == 2
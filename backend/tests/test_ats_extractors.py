@@ -0,0 +1,35 @@
+from backend import ats_extractors
+from backend.ats_extractors import extract
+
+def _msg(sender, subject, body):
+    return {"sender": sender, "subject": subject, "body": body}
+
+def test_templates_of_each_ats_are_parsed_without_the_llm():
+    cases = [
+        (_msg("Acme <no-reply@us.greenhouse-mail.io>", "Thank you for applying to Acme!",
+              "Hi Sam,\n\nThanks for applying to Acme. Your application for the Backend Engineer role at Acme has been received."),
+         ("Acme", "Backend Engineer", "APPLIED")),
+        (_msg("Globex <no-reply@hire.lever.co>", "Globex application update: Data Analyst",
+              "Unfortunately, we have decided to move forward with other candidates."),
+         ("Globex", "Data Analyst", "REJECTED")),
+        (_msg("Initech <initech@myworkday.com>", "Initech - Application Received - R12345 Product Manager",
+              "Thank you for applying! We have received your application."),
+         ("Initech", "Product Manager", "APPLIED")),
+        (_msg("Hooli <no-reply@ashbyhq.com>", "Thanks for your interest in Hooli",
+              "We'd like to schedule an interview for the Site Reliability Engineer role at Hooli."),
+         ("Hooli", "Site Reliability Engineer", "INTERVIEWING")),
+        (_msg("Umbrella <noreply@smartrecruiters.com>", "Your application for Lab Technician at Umbrella",
+              "Thank you for your application. We are pleased to extend an offer."),
+         ("Umbrella", "Lab Technician", "OFFER")),
+    ]
+    for msg, (company, title, status) in cases:
+        result = extract(msg)
+        assert result and (result["company_name"], result["job_title"], result["status"]) == (company, title, status), msg
+
+def test_unknown_senders_and_partial_matches_fall_through_to_the_llm():
+    assert extract(_msg("recruiter@acme.com", "Thank you for applying to Acme", "We received your application.")) is None
+    # Company and status but no role: not confident enough
+    before = ats_extractors.COUNTERS["greenhouse"]["hits"]
+    assert extract(_msg("no-reply@greenhouse.io", "Thank you for applying to Acme", "We received your application.")) is None
+    assert ats_extractors.COUNTERS["greenhouse"]["hits"] == before
+    assert ats_extractors.hit_rates()["greenhouse"]["tried"] > 0
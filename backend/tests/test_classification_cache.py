@@ -0,0 +1,111 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend import classification_cache, llm_service, scan_service
+from backend.classification_cache import get_cached_message_ids, get_cached_results, store_results
+from backend.database import Base
+from backend.models import ClassificationCache
+from backend.prefilter import train_model
+
+ME, OTHER = 1, 2
+
+def _db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+class _Progress:
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, key, n=1):
+        self.counts[key] += n
+
+def _state():
+    return {"failed_ids": set(), "threads": {"messages": 0, "threads": 0}, "ats": {"matched": 0},
+            "preprocess": {"emails": 0, "chars_in": 0, "chars_out": 0}}
+
+def _msg(id, body):
+    return {"id": id, "thread_id": f"t{id}", "subject": "Update", "sender": "jobs@example.com", "date": None, "body": body}
+
+def test_hits_include_cached_nulls_and_miss_on_any_key_change(monkeypatch):
+    db = _db()
+    store_results(db, ME, [
+        ("m1", "text 1", {"company_name": "Acme"}, "Update", "jobs@acme.com"),
+        ("m2", "text 2", None, "Newsletter", "news@example.com"),
+    ])
+    db.commit()
+
+    # A cached null means "not a job email" and is a hit like any other result
+    assert get_cached_results(db, ME, [("m1", "text 1"), ("m2", "text 2")]) == {"m1": {"company_name": "Acme"}, "m2": None}
+    # The text sent to the model changed
+    assert get_cached_results(db, ME, [("m1", "text 1, edited")]) == {}
+    # Metadata lookups don't know the text yet, so they only check model and prompt version
+    assert get_cached_message_ids(db, ME, ["m1", "m2", "m3"]) == {"m1", "m2"}
+
+    monkeypatch.setattr(classification_cache, "GEMINI_MODEL", "other-model")
+    assert get_cached_results(db, ME, [("m1", "text 1")]) == {} and get_cached_message_ids(db, ME, ["m1"]) == set()
+    monkeypatch.undo()
+    monkeypatch.setattr(classification_cache, "PROMPT_VERSION", "other-prompt")
+    assert get_cached_results(db, ME, [("m1", "text 1")]) == {} and get_cached_message_ids(db, ME, ["m1"]) == set()
+
+def test_store_replaces_only_the_same_messages_entries():
+    db = _db()
+    store_results(db, ME, [
+        ("m1", "old text", {"company_name": "Old"}, "Update", "jobs@acme.com"),
+        ("m2", "text 2", None, "Newsletter", "news@example.com"),
+    ])
+    # Another mailbox can use the same message id
+    store_results(db, OTHER, [("m1", "their text", None, "Hello", "friend@example.com")])
+    store_results(db, ME, [("m1", "new text", {"company_name": "New"}, "Update", "jobs@acme.com")])
+    db.commit()
+
+    assert sorted((row.user_id, row.message_id) for row in db.query(ClassificationCache)) == [(ME, "m1"), (ME, "m2"), (OTHER, "m1")]
+    assert get_cached_results(db, ME, [("m1", "new text"), ("m2", "text 2")]) == {"m1": {"company_name": "New"}, "m2": None}
+    assert get_cached_results(db, OTHER, [("m1", "new text"), ("m2", "text 2")]) == {}
+    assert get_cached_message_ids(db, OTHER, ["m1", "m2"]) == {"m1"}
+
+def test_prefilter_trains_only_on_the_users_own_mail():
+    db = _db()
+    store_results(db, ME, [(f"m{i}", "text", {"company_name": "Acme"}, "Application received", "jobs@acme.com") for i in range(3)])
+    store_results(db, OTHER, [(f"m{i}", "text", None, "Weekly digest", "news@example.com") for i in range(5)])
+    db.commit()
+
+    assert train_model(db, ME).docs == {True: 3, False: 0}
+    assert train_model(db, OTHER).docs == {True: 0, False: 5}
+
+def _classify(db, messages, progress):
+    llm = ThreadPoolExecutor(max_workers=2)
+    state = _state()
+    try:
+        chunk = scan_service._start_classify(db, ME, messages, llm, progress, state)
+        wait(chunk.futures)
+        return scan_service._finish_classify(db, ME, chunk, state)
+    finally:
+        llm.shutdown()
+
+def test_scans_skip_the_llm_for_hits_and_never_cache_failures(monkeypatch):
+    db = _db()
+    calls = []
+
+    def safe_parse_batch(batch):
+        calls.append([message_id for message_id, _ in batch])
+        # m3 fails every attempt, so it comes back failed rather than null
+        return {message_id: {"company_name": "Acme", "job_title": "Engineer", "status": "APPLIED"} if message_id == "m2"
+                else llm_service._FAILED if message_id == "m3" else None for message_id, _ in batch}
+
+    monkeypatch.setattr(llm_service, "_safe_parse_batch", safe_parse_batch)
+    messages = [_msg("m1", "Thanks for your interest."), _msg("m2", "We received your application."), _msg("m3", "Hello")]
+
+    first = _classify(db, messages, _Progress())
+    assert calls == [["m1", "m2", "m3"]]
+    assert [result for _, result in first] == [None, {"company_name": "Acme", "job_title": "Engineer", "status": "APPLIED"}, None]
+    assert sorted(row.message_id for row in db.query(ClassificationCache)) == ["m1", "m2"]
+
+    # The rescan only sends the failed message; m1's cached null and m2's result are hits
+    progress = _Progress()
+    second = _classify(db, messages, progress)
+    assert calls[-1] == ["m3"]
+    assert [result for _, result in second] == [result for _, result in first]
+    assert progress.counts["classified"] == 3
@@ -0,0 +1,36 @@
+import base64
+from backend.email_body import extract_body
+
+def _part(mime_type, text, charset="utf-8", **extra):
+    return {
+        "mimeType": mime_type,
+        "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}],
+        "body": {"data": base64.urlsafe_b64encode(text.encode(charset)).decode()},
+        **extra,
+    }
+
+def test_walks_mixed_and_related_parts_and_skips_attachments():
+    payload = {"mimeType": "multipart/mixed", "parts": [
+        {"mimeType": "multipart/related", "parts": [
+            {"mimeType": "multipart/alternative", "parts": [
+                _part("text/plain", "Thanks for applying to Acme."),
+                _part("text/html", "<p>Thanks for applying to <b>Acme</b>.</p>"),
+            ]},
+            {"mimeType": "image/png", "filename": "logo.png", "body": {"attachmentId": "a1"}},
+        ]},
+        _part("text/plain", "resume text", filename="resume.txt"),
+    ]}
+    assert extract_body(payload) == "Thanks for applying to Acme."
+
+def test_falls_back_to_html_in_its_declared_charset():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        _part("text/html", "<html><head><style>p {}</style></head><body><p>Entrevista &amp; café</p><br>Próximos pasos</body></html>",
+              charset="iso-8859-1"),
+    ]}
+    assert extract_body(payload) == "Entrevista & café\nPróximos pasos"
+
+def test_stops_decoding_at_the_byte_budget():
+    payload = _part("text/plain", "é" * 10_000)
+    body = extract_body(payload, max_bytes=101)
+    # 50 two-byte characters fit; the half character at the cut is dropped
+    assert body == "é" * 50
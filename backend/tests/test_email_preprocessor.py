@@ -0,0 +1,56 @@
+from backend.ats_extractors import extract
+from backend.email_preprocessor import clean_body, prepare_email, prepare_emails, raw_chars, thread_context
+
+def test_strips_quotes_signatures_footers_and_long_urls():
+    body = (
+        "Hi Sam,\r\n\r\n\r\n\r\nThanks for   applying to Acme. We'd like to schedule an interview.\r\n"
+        "Book a slot: https://acme.greenhouse.io/interviews/schedule?token=abcdef0123456789abcdef\r\n"
+        "> quoted line\r\n"
+        "--\r\nJane Doe | Recruiter\r\n"
+        "On Mon, Sep 1, 2025 at 10:00 AM Sam <sam@example.com> wrote:\r\n> earlier message\r\n"
+    )
+    assert clean_body(body) == (
+        "Hi Sam,\n\nThanks for applying to Acme. We'd like to schedule an interview.\n"
+        "Book a slot: [link: acme.greenhouse.io]"
+    )
+    footer = "Your application was received.\nUnsubscribe | Manage preferences\n© 2025 Acme Inc. All rights reserved."
+    assert clean_body(footer) == "Your application was received."
+
+def test_keeps_status_sentences_that_share_a_paragraph_with_boilerplate():
+    paragraph = ("Hi Sam, thank you for your interest. Unfortunately we have decided not to move forward with your application "
+                 "for the Backend Engineer role at Acme. Please do not reply to this email.")
+    assert clean_body(paragraph) == (
+        "Hi Sam, thank you for your interest. Unfortunately we have decided not to move forward with your application "
+        "for the Backend Engineer role at Acme."
+    )
+    # The ATS templates read the same cleaned body
+    result = extract({"sender": "Acme <no-reply@us.greenhouse-mail.io>", "subject": "Update on your application", "body": paragraph})
+    assert (result["company_name"], result["job_title"], result["status"]) == ("Acme", "Backend Engineer", "REJECTED")
+
+def test_keeps_the_highest_signal_sentences_within_budget():
+    filler = "Our company values collaboration and growth. " * 20
+    body = filler + "Unfortunately, we have decided not to move forward with your application. " + filler
+    text = prepare_email("Update from Acme", body, budget=200)
+    assert len(text) <= 200
+    assert text.startswith("Subject: Update from Acme\n\nBody:\n")
+    assert "not to move forward with your application" in text
+
+def test_reports_characters_saved():
+    messages = [{"id": "m1", "subject": "Hi", "body": "Thanks for applying.\n\n> old reply" * 50}]
+    texts, stats = prepare_emails(messages, budget=100)
+    assert texts[0][0] == "m1"
+    assert stats["emails"] == 1 and stats["chars_in"] > stats["chars_out"] == len(texts[0][1])
+
+    # Savings are measured against the 8,000 characters the scan used to send at most
+    texts, stats = prepare_emails([{"id": "m2", "subject": "Hi", "body": "Thanks for applying. " * 1500}])
+    assert stats["chars_in"] == 8000
+
+def test_collapsed_threads_count_their_folded_messages_as_input():
+    earlier = [{"subject": "Acme", "body": f"Thanks for applying. Message {i}. " * 20, "date": None, "sender": "jobs@acme.com"}
+               for i in range(3)]
+    newest = {"id": "m4", "subject": "Acme", "body": "We'd like to schedule an interview.",
+              "thread_context": thread_context(earlier), "thread_chars": sum(raw_chars(m) for m in earlier)}
+    texts, stats = prepare_emails([newest])
+    assert stats["chars_in"] == raw_chars(newest) + newest["thread_chars"]
+    # The context is a summary of those messages, so collapsing saves characters overall
+    assert stats["chars_in"] > stats["chars_out"] == len(texts[0][1])
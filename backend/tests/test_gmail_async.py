@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from backend import gmail_async
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await gmail_async.close_client()
+    return asyncio.run(main())
+
+def test_profile_list_and_get_with_fields(gmail):
+    assert _run(gmail_async.get_profile("good"))["emailAddress"] == "me@example.com"
+
+    page = _run(gmail_async.list_messages("good", q="offer", max_results=2))
+    assert [m["id"] for m in page["messages"]] == ["m1", "m2"] and page["nextPageToken"] == "2"
+
+    message = _run(gmail_async.get_message("good", "m3", format="metadata", fields="id,threadId,payload/headers",
+                                           metadata_headers=["Subject", "From"]))
+    assert message["id"] == "m3" and "body" not in message["payload"]
+    assert gmail.requests[-1] == ("messages/m3", {"format": ["metadata"], "fields": ["id,threadId,payload/headers"],
+                                                  "metadataHeaders": ["Subject", "From"]})
+
+    with pytest.raises(gmail_async.GmailError) as error:
+        _run(gmail_async.get_profile("bad"))
+    assert error.value.status == 401
+
+def test_history_skips_sent_mail_and_reports_expired_cursors(gmail):
+    messages, history_id = _run(gmail_async._list_history_message_ids("good", "800", 100))
+    assert messages == [{"id": "m2", "threadId": "t2"}] and history_id == "950"
+
+    with pytest.raises(gmail_async.HistoryExpired):
+        _run(gmail_async.list_history("good", "1"))
+
+def test_history_over_the_limit_resumes_after_the_last_complete_record(gmail):
+    gmail.history = [
+        {"id": str(901 + i), "messagesAdded": [{"message": {"id": f"m{i}", "threadId": f"t{i}"}}]}
+        for i in range(5)
+    ]
+    messages, history_id = _run(gmail_async._list_history_message_ids("good", "800", 3))
+    # The oldest messages are scanned first and nothing after the cursor is skipped
+    assert [m["id"] for m in messages] == ["m0", "m1", "m2"] and history_id == "903"
+
+def test_incremental_scans_only_fetch_history_messages_the_search_matches(gmail):
+    gmail.history = [{"id": str(901 + i), "messagesAdded": [{"message": {"id": f"m{i}", "threadId": f"tm{i}"}}]}
+                     for i in range(1, 5)]
+    gmail.matching = {"m1", "m3", "m5"}
+
+    batches, history_id = gmail_async.run(gmail_async.stream_emails("good", start_history_id="800", exclude_senders=["x.com"]))
+    emails = [email for batch in gmail_async.iter_blocking(batches) for email in batch]
+    assert history_id == "950"
+    assert [email["id"] for email in emails] == ["m1", "m3"]
+
+    # Searched from a day before the oldest new message, with the usual exclusions
+    query = next(params["q"][0] for path, params in gmail.requests if path == "messages")
+    assert query.endswith(f'after:{1704103200 - 86400} -from:"x.com"')
+    assert "-from:calendar-notification@google.com" in query
+
+def test_concurrent_gets_retry_rate_limits_and_count_losses(gmail, monkeypatch):
+    monkeypatch.setattr(gmail_async, "GMAIL_MAX_RETRIES", 2)
+    gmail.failures = {"m1": 1, "m4": 5}
+    stats = {}
+    responses = _run(gmail_async.get_messages("good", ["m1", "m2", "m3", "m4"], stats=stats, format="full"))
+    assert [r["id"] for r in responses] == ["m1", "m2", "m3"]
+    assert stats == {"retried": 3, "lost": 1}
+
+def test_stream_emails_downloads_only_selected_messages(gmail):
+    def select(metas):
+        return [meta for meta in metas if meta["subject"] != "Subject 2"]
+
+    batches, history_id = gmail_async.run(gmail_async.stream_emails("good", max_results=10, select=select))
+    emails = [email for batch in gmail_async.iter_blocking(batches) for email in batch]
+    assert history_id == "900"
+    assert [email["body"] for email in emails] == ["Body 1", "Body 3", "Body 4", "Body 5"]
+    full = [path for path, params in gmail.requests if params.get("format") == ["full"]]
+    assert "messages/m2" not in full and len(full) == 4
+
+def test_chunks_keep_threads_together():
+    messages = [{"id": f"m{i}", "threadId": t} for i, t in enumerate(["a", "b", "a", "c", "b", "d"])]
+    assert gmail_async.chunk_by_thread(messages, size=3) == [["m0", "m2"], ["m1", "m4", "m3"], ["m5"]]
+    assert gmail_async.chunk_by_thread([{"id": f"m{i}", "threadId": "a"} for i in range(5)], size=2) == [["m0", "m1"], ["m2", "m3"], ["m4"]]
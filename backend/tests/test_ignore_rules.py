@@ -0,0 +1,61 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import JobApplication, User
+from backend.ignore_rules import IgnoreMatcher, domain_matches, parse_rules, prune_ignored_jobs, split_sender
+from backend.gmail_async import _search_query
+
+def test_parse_rules_splits_addresses_and_domains():
+    rules = parse_rules(" Spam@X.com, lever.co,@greenhouse.io,, lever.co ")
+    assert rules == [("address", "spam@x.com"), ("domain", "lever.co"), ("domain", "greenhouse.io")]
+
+def test_parse_rules_drops_entries_that_are_not_addresses_or_domains():
+    rules = parse_rules('foo bar, localhost, "x" OR y@z.com, a@b@c.com, (x), jobs@hire.lever.co, @, x.com OR offer')
+    assert rules == [("address", "jobs@hire.lever.co")]
+
+def test_matcher_checks_addresses_and_parent_domains():
+    matcher = IgnoreMatcher(parse_rules("spam@x.com, lever.co"))
+    assert matcher.matches("Spam <SPAM@x.com>")
+    assert matcher.matches("no-reply@hire.lever.co")
+    assert not matcher.matches("friend@notlever.co")
+    assert not matcher.matches("other@x.com")
+    assert not matcher.matches("not an address")
+
+def test_domains_match_themselves_and_subdomains_but_not_bare_tlds():
+    assert domain_matches("lever.co", {"lever.co"})
+    assert domain_matches("us.hire.lever.co", {"lever.co"})
+    assert not domain_matches("notlever.co", {"lever.co"})
+    assert not domain_matches("lever.co", {"co"})
+    assert not domain_matches(None, {"lever.co"})
+
+def test_ignored_senders_are_excluded_from_the_gmail_search(monkeypatch):
+    monkeypatch.setattr("backend.gmail_async.GMAIL_QUERY_MAX_EXCLUDES", 2)
+    senders = IgnoreMatcher(parse_rules("spam@x.com, lever.co, greenhouse.io")).senders()
+    query = _search_query(senders)
+    assert query.endswith(' -from:"spam@x.com" -from:"greenhouse.io"')
+
+def test_prune_deletes_only_matching_jobs_of_the_user():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    me, other = User(email="me@example.com"), User(email="other@example.com")
+    db.add_all([me, other])
+    db.commit()
+
+    def job(user, title, sender):
+        address, domain = split_sender(sender)
+        return JobApplication(user_id=user.id, company_name="Acme", job_title=title,
+                              sender_email=sender, sender_address=address, sender_domain=domain)
+
+    db.add_all([
+        job(me, "A", "Spam <spam@x.com>"),
+        job(me, "B", "Acme <no-reply@hire.lever.co>"),  # Subdomain of a domain rule
+        job(me, "C", "Friend <friend@notlever.co>"),
+        job(other, "A", "Spam <spam@x.com>"),
+    ])
+    db.commit()
+
+    assert prune_ignored_jobs(db, me.id, parse_rules("spam@x.com, lever.co")) == 2
+    db.commit()
+    remaining = {(job.user_id, job.job_title) for job in db.query(JobApplication)}
+    assert remaining == {(me.id, "C"), (other.id, "A")}
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+from backend.models import JobApplication
+
+pytestmark = pytest.mark.usefixtures("signed_in")
+
+def test_jobs_paginate_by_keyset_and_revalidate_with_etag(client, db, user):
+    start = datetime(2024, 1, 1)
+    db.add_all(JobApplication(user_id=user.id, company_name=f"C{i}", job_title="Engineer", date_applied=start + timedelta(days=i // 2))
+               for i in range(5))
+    db.commit()
+
+    names, cursor = [], None
+    while True:
+        response = client.get("/jobs/", params={"limit": 2, "fields": "company_name", **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        names += [job["company_name"] for job in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert names == ["C4", "C3", "C2", "C1", "C0"]
+
+    etag = client.get("/jobs/").headers["ETag"]
+    assert client.get("/jobs/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.put("/jobs/1", json={"status": "OFFER"}).status_code == 200
+    assert client.get("/jobs/", headers={"If-None-Match": etag}).status_code == 200
+
+def test_batch_applies_creates_updates_and_deletes(client):
+    response = client.post("/jobs/batch", json={"create": [
+        {"company_name": "Acme", "job_title": "Engineer"},
+        {"company_name": "Globex", "job_title": "Engineer"},
+        {"company_name": "Acme", "job_title": "Engineer"},
+    ]})
+    assert [r["status"] for r in response.json()["created"]] == ["created", "created", "duplicate"]
+
+    response = client.post("/jobs/batch", json={"update": [{"id": 1, "status": "REJECTED"}], "delete": [2, 99]})
+    assert [r["status"] for r in response.json()["updated"]] == ["updated"]
+    assert [r["status"] for r in response.json()["deleted"]] == ["deleted", "not_found"]
+
+    stats = client.get("/analytics/stats").json()
+    assert stats["summary"]["total"] == 1
+    assert stats["funnel_counts"]["REJECTED"] == 1
+
+def test_renames_onto_an_existing_role_are_reported_as_duplicates(client):
+    client.post("/jobs/batch", json={"create": [
+        {"company_name": "C1", "job_title": "Engineer"},
+        {"company_name": "C2", "job_title": "Engineer"},
+    ]})
+
+    response = client.post("/jobs/batch", json={"update": [{"id": 2, "company_name": "C1"}]})
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["updated"]] == ["duplicate"]
+
+    # A role freed earlier in the same batch can be taken by a later item
+    response = client.post("/jobs/batch", json={"update": [
+        {"id": 1, "company_name": "C3"},
+        {"id": 2, "company_name": "C1"},
+        {"id": 2, "company_name": "C3"},
+    ]})
+    assert [r["status"] for r in response.json()["updated"]] == ["updated", "updated", "duplicate"]
+    names = {job["id"]: job["company_name"] for job in client.get("/jobs/").json()}
+    assert names == {1: "C3", 2: "C1"}
+
+    assert client.put("/jobs/2", json={"company_name": "C3"}).status_code == 400
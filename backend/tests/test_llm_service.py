@@ -0,0 +1,28 @@
+import json
+from backend import llm_service
+
+def test_batch_falls_back_to_single_calls(monkeypatch):
+    calls = []
+
+    def fake_generate(prompt):
+        calls.append(prompt)
+        if "=== MESSAGE" in prompt:
+            # Answer "a" properly, "b" malformed, "c" missing entirely
+            return json.dumps([
+                {"message_id": "a", "result": {"company_name": "Acme", "status": "APPLIED"}},
+                {"message_id": "b", "result": "oops"},
+            ])
+        return json.dumps({"company_name": "Single", "status": "REJECTED"})
+
+    monkeypatch.setattr(llm_service, "_generate", fake_generate)
+
+    results = llm_service.parse_job_applications(
+        [("a", "email a"), ("b", "email b"), ("c", "email c")], batch_size=3
+    )
+
+    assert [r["company_name"] for r in results] == ["Acme", "Single", "Single"]
+    assert len(calls) == 3
+
+def test_batches_respect_char_budget():
+    batches = llm_service._pack_batches([("a", "x" * 6), ("b", "x" * 6), ("c", "x" * 3)], 10, 10)
+    assert [[m for m, _ in b] for b in batches] == [["a"], ["b", "c"]]
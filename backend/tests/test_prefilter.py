@@ -0,0 +1,22 @@
+from backend.prefilter import BagOfWordsModel, filter_candidates, score_message
+
+def test_rules_drop_alerts_and_keep_ats_mail():
+    alert = {"subject": "New jobs for you: Software Engineer", "sender": "LinkedIn <jobalerts-noreply@jobalerts.linkedin.com>"}
+    ats = {"subject": "Thank you for applying to Acme", "sender": "Acme <no-reply@us.greenhouse-mail.io>"}
+    neutral = {"subject": "Quick question", "sender": "friend@gmail.com"}
+
+    kept, dropped, stats = filter_candidates([alert, ats, neutral], threshold=0.15)
+
+    assert dropped == [alert]
+    assert kept == [ats, neutral]
+    assert stats["dropped"] == 1
+
+def test_bag_of_words_model_learns_from_outcomes(monkeypatch):
+    monkeypatch.setattr("backend.prefilter.PREFILTER_MIN_EXAMPLES", 2)
+    model = BagOfWordsModel()
+    for _ in range(3):
+        model.add(["coupon", "domain:shop.com"], False)
+        model.add(["recruiting", "domain:acme.com"], True)
+
+    msg = {"subject": "Coupon inside", "sender": "deals@shop.com"}
+    assert score_message(msg, model) < score_message(msg)
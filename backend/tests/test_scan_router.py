@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+import pytest
+from backend import scan_service
+from backend.models import ScanJob, ScanStatus
+from backend.routers import scan as scan_router
+
+pytestmark = pytest.mark.usefixtures("signed_in")
+
+class _Executor:
+    """Records submitted scans instead of running them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+@pytest.fixture
+def executor(monkeypatch):
+    async def get_profile(token):
+        return {"emailAddress": "me@example.com"}
+
+    executor = _Executor()
+    monkeypatch.setattr(scan_service, "_executor", executor)
+    monkeypatch.setattr(scan_router, "get_profile", get_profile)
+    return executor
+
+def test_start_reuses_the_active_scan_and_cancel_flags_it(client, db, executor):
+    response = client.post("/scan/", headers={"token": "good"})
+    assert response.status_code == 202
+    scan = response.json()
+    assert scan["status"] == "PENDING"
+    assert executor.submitted == [(scan["scan_id"], "good")]
+
+    # A second request while the first is pending gets the same scan
+    assert client.post("/scan/", headers={"token": "good"}).json()["scan_id"] == scan["scan_id"]
+    assert len(executor.submitted) == 1
+
+    assert client.get(f"/scan/{scan['scan_id']}").json()["status"] == "PENDING"
+    assert client.post(f"/scan/{scan['scan_id']}/cancel").status_code == 200
+    assert db.get(ScanJob, scan["scan_id"]).cancel_requested
+    assert client.get("/scan/unknown").status_code == 404
+
+def test_scans_that_stop_reporting_are_failed_and_replaced(client, db, user, executor):
+    stale = datetime.utcnow() - timedelta(seconds=scan_service.SCAN_STALE_SECONDS + 60)
+    db.add(ScanJob(id="dead", user_id=user.id, status=ScanStatus.RUNNING, created_at=stale, updated_at=stale))
+    db.commit()
+
+    # A new scan doesn't wait on the dead one
+    scan = client.post("/scan/", headers={"token": "good"}).json()
+    assert scan["scan_id"] != "dead" and len(executor.submitted) == 1
+
+    status = client.get("/scan/dead").json()
+    assert status["status"] == "FAILED" and status["finished_at"]
+    assert "stopped responding" in status["message"]
+    db.expire_all()
+    assert db.get(ScanJob, "dead").status == ScanStatus.FAILED
+    # Scans still reporting are left alone
+    assert client.get(f"/scan/{scan['scan_id']}").json()["status"] == "PENDING"
@@ -0,0 +1,251 @@
+import queue
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import JobApplication, JobStatus, ScanJob, ScanStatus, User
+from backend import llm_service, prefilter, scan_service
+from backend.classification_cache import store_results
+from backend.scan_service import _DONE, _collapse_threads, _job_row, _upsert_jobs
+from backend.analytics_service import RollupDelta, compute_stats, rebuild_rollup, record_job_changes
+
+def test_upsert_keeps_the_earliest_date_and_the_newest_status():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(email="me@example.com")
+    db.add(user)
+    db.commit()
+
+    def row(thread_id, company, status, date):
+        msg = {"thread_id": thread_id, "sender": "jobs@acme.com", "date": date}
+        return _job_row(user, msg, {"company_name": company, "job_title": "Engineer", "status": status})
+
+    assert _upsert_jobs(db, user, [row("t1", "Acme", "APPLIED", "Mon, 1 Jan 2024 10:00:00 +0000")]) == 0
+    assert _upsert_jobs(db, user, [
+        row("t2", "Acme", "REJECTED", "Mon, 8 Jan 2024 10:00:00 +0000"),
+        # Rows for one role in a batch are merged by date, not list order
+        row("t4", "Globex", "INTERVIEWING", "Tue, 9 Jan 2024 10:00:00 +0000"),
+        row("t3", "Globex", "APPLIED", "Mon, 8 Jan 2024 10:00:00 +0000"),
+    ]) == 1
+    # An older email moves the applied date back but doesn't undo the newer status
+    assert _upsert_jobs(db, user, [row("t0", "Acme", "APPLIED", "Thu, 28 Dec 2023 10:00:00 +0000")]) == 1
+    db.commit()
+
+    jobs = {job.company_name: job for job in db.query(JobApplication)}
+    assert len(jobs) == 2
+    assert (jobs["Acme"].status, jobs["Acme"].thread_id, jobs["Acme"].date_applied.date()) == (
+        JobStatus.REJECTED, "t2", datetime(2023, 12, 28).date())
+    assert (jobs["Globex"].status, jobs["Globex"].thread_id, jobs["Globex"].date_applied.date()) == (
+        JobStatus.INTERVIEWING, "t4", datetime(2024, 1, 8).date())
+
+    # The analytics rollup followed every merge in the same transaction
+    stats = compute_stats(db, user.id, weeks=3, today=datetime(2024, 1, 10))
+    assert stats["funnel_counts"]["APPLIED"] == 0
+    assert stats["funnel_counts"]["REJECTED"] == 1 and stats["funnel_counts"]["INTERVIEWING"] == 1
+    assert stats["weekly_activity"] == [
+        {"week": "2023-12-25", "count": 1}, {"week": "2024-01-01", "count": 0}, {"week": "2024-01-08", "count": 1},
+    ]
+
+def test_upsert_counts_board_edits_made_while_the_scan_ran():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(email="me@example.com")
+    db.add(user)
+    db.commit()
+
+    def row(thread_id, company, status, date):
+        msg = {"thread_id": thread_id, "sender": "jobs@acme.com", "date": date}
+        return _job_row(user, msg, {"company_name": company, "job_title": "Engineer", "status": status})
+
+    _upsert_jobs(db, user, [row("t1", "Acme", "APPLIED", "Mon, 1 Jan 2024 10:00:00 +0000"),
+                            row("t2", "Globex", "APPLIED", "Mon, 1 Jan 2024 10:00:00 +0000")])
+    db.commit()
+
+    # Meanwhile on the board: Acme is moved to OFFER by hand and Globex is deleted
+    jobs = {job.company_name: job for job in db.query(JobApplication)}
+    delta = RollupDelta()
+    delta.remove(JobStatus.APPLIED, jobs["Acme"].date_applied)
+    delta.add(JobStatus.OFFER, jobs["Acme"].date_applied)
+    delta.remove(JobStatus.APPLIED, jobs["Globex"].date_applied)
+    jobs["Acme"].status, jobs["Acme"].status_updated_at = JobStatus.OFFER, datetime.utcnow()
+    db.delete(jobs["Globex"])
+    record_job_changes(db, user.id, delta)
+    db.commit()
+
+    # A later chunk of the same scan finds both roles again
+    assert _upsert_jobs(db, user, [row("t1", "Acme", "REJECTED", "Tue, 2 Jan 2024 10:00:00 +0000"),
+                                   row("t2", "Globex", "APPLIED", "Tue, 2 Jan 2024 10:00:00 +0000")]) == 1
+    db.commit()
+
+    assert db.query(JobApplication).filter_by(company_name="Acme").one().status == JobStatus.OFFER
+    stats = compute_stats(db, user.id, weeks=1, today=datetime(2024, 1, 3))
+    rebuild_rollup(db, user.id)
+    db.commit()
+    assert stats == compute_stats(db, user.id, weeks=1, today=datetime(2024, 1, 3))
+    assert stats["funnel_counts"]["APPLIED"] == 1 and stats["funnel_counts"]["OFFER"] == 1
+
+def test_threads_collapse_to_the_newest_message_with_the_earliest_date():
+    def msg(id, thread_id, date, body):
+        return {"id": id, "thread_id": thread_id, "subject": "Acme", "sender": "jobs@acme.com", "date": date, "body": body}
+
+    emails = [
+        msg("m3", "t1", "Wed, 10 Jan 2024 10:00:00 +0000", "Unfortunately we will not move forward."),
+        msg("m1", "t1", "Mon, 1 Jan 2024 10:00:00 +0000", "Thanks for applying to Acme."),
+        msg("m9", "t2", "Tue, 2 Jan 2024 10:00:00 +0000", "Other thread"),
+        msg("m2", "t1", "Fri, 5 Jan 2024 10:00:00 +0000", "We'd like to schedule an interview."),
+    ]
+    collapsed = _collapse_threads(emails)
+    assert [m["id"] for m in collapsed] == ["m3", "m9"]
+
+    thread = collapsed[0]
+    assert thread["body"] == "Unfortunately we will not move forward."
+    assert thread["date"] == "Mon, 1 Jan 2024 10:00:00 +0000"
+    assert thread["thread_context"].splitlines() == [
+        "- Mon, 1 Jan 2024 10:00:00 +0000 | jobs@acme.com: Thanks for applying to Acme.",
+        "- Fri, 5 Jan 2024 10:00:00 +0000 | jobs@acme.com: We'd like to schedule an interview.",
+    ]
+    assert "thread_context" not in collapsed[1]
+
+class _Progress:
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, key, n=1):
+        self.counts[key] += n
+
+def test_next_chunk_starts_while_the_previous_one_is_still_classifying(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(scan_service, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(scan_service, "LLM_MAX_CONCURRENCY", 4)
+    # Each chunk's only prompt waits for the other chunk's: both have to be in flight at once
+    both_in_flight = threading.Barrier(2, timeout=5)
+
+    def safe_parse_batch(batch):
+        both_in_flight.wait()
+        return {message_id: None for message_id, _ in batch}
+
+    monkeypatch.setattr(llm_service, "_safe_parse_batch", safe_parse_batch)
+    in_q, out_q = queue.Queue(), queue.Queue()
+    for i in range(2):
+        in_q.put([{"id": f"m{i}", "thread_id": f"t{i}", "subject": "Hi", "sender": "a@example.com", "date": None, "body": "Hello"}])
+    in_q.put(_DONE)
+    state = {"failed_ids": set(), "threads": {"messages": 0, "threads": 0}, "ats": {"matched": 0},
+             "preprocess": {"emails": 0, "chars_in": 0, "chars_out": 0}}
+
+    scan_service._classify_stage(1, in_q, out_q, threading.Event(), _Progress(), state)
+    assert [[msg["id"] for msg, _ in out_q.get()] for _ in range(2)] == [["m0"], ["m1"]]
+    assert out_q.get() is _DONE and not state["failed_ids"]
+
+def test_known_threads_only_let_through_replies_newer_than_the_board(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    monkeypatch.setattr(prefilter, "PREFILTER_THRESHOLD", float("-inf"))
+    store_results(db, 1, [("m4", "text", None, "Re: Acme", "jobs@acme.com")])
+    db.commit()
+
+    def meta(id, thread_id, date):
+        return {"id": id, "thread_id": thread_id, "subject": "Re: Acme", "sender": "jobs@acme.com", "date": date}
+
+    metas = [
+        meta("m1", "t1", "Mon, 1 Jan 2024 10:00:00 +0000"),   # the email the role came from
+        meta("m2", "t1", "Fri, 5 Jan 2024 10:00:00 +0000"),   # a reply that came in later
+        meta("m3", "t1", None),
+        meta("m4", "t1", "Sat, 6 Jan 2024 10:00:00 +0000"),   # classified on an earlier scan
+        meta("m5", "t2", "Mon, 1 Jan 2024 10:00:00 +0000"),
+    ]
+    state = {"prefilter": {"scored": 0, "dropped": 0}}
+    progress = _Progress()
+    selected = scan_service._select_for_download(db, 1, metas, None, {"t1": datetime(2024, 1, 1, 10)}, None, progress, state)
+    assert [m["id"] for m in selected] == ["m2", "m5"]
+    assert progress.counts == {"fetched": 5, "classified": 3}
+
+class _Mailbox:
+    """Stands in for gmail_async.stream_emails, serving fixed batches of emails."""
+
+    def __init__(self, batches, lost=0):
+        self.batches = batches
+        self.lost = lost
+        self.calls = []
+        self.on_batch = None
+
+    async def stream_emails(self, token, start_history_id=None, max_results=500, select=None, stats=None, exclude_senders=None):
+        self.calls.append(start_history_id)
+        stats["lost"] += self.lost
+
+        async def batches():
+            for i, batch in enumerate(self.batches):
+                if self.on_batch:
+                    self.on_batch(i)
+                yield select(batch)
+        return batches(), "950"
+
+def _email(id):
+    # Classified as a role at company `id.upper()`
+    return {"id": id, "thread_id": f"t{id}", "subject": "Your application", "sender": "jobs@example.com",
+            "date": "Mon, 1 Jan 2024 10:00:00 +0000", "body": "Thanks for applying."}
+
+@pytest.fixture
+def scan(db_url, db, user, monkeypatch):
+    """Runs a scan for `user` through _run_scan_job on the given mailbox; returns the finished ScanJob."""
+    monkeypatch.setattr(scan_service, "SessionLocal", sessionmaker(bind=create_engine(db_url)))
+    monkeypatch.setattr(scan_service.ScanProgress, "MIN_INTERVAL", 0)
+    monkeypatch.setattr(prefilter, "PREFILTER_THRESHOLD", float("-inf"))
+    user.gmail_history_id = "800"
+    db.commit()
+
+    def scan(mailbox, failing=()):
+        def safe_parse_batch(batch):
+            return {message_id: llm_service._FAILED if message_id in failing else
+                    {"company_name": message_id.upper(), "job_title": "Engineer", "status": "APPLIED"} for message_id, _ in batch}
+
+        monkeypatch.setattr(scan_service, "stream_emails", mailbox.stream_emails)
+        monkeypatch.setattr(llm_service, "_safe_parse_batch", safe_parse_batch)
+        job = ScanJob(id=uuid.uuid4().hex, user_id=user.id, status=ScanStatus.PENDING)
+        db.add(job)
+        db.commit()
+        scan_service._run_scan_job(job.id, "good")
+        db.expire_all()
+        return job
+    return scan
+
+def test_completed_scans_persist_every_chunk_and_advance_the_cursor(scan, db, user):
+    mailbox = _Mailbox([[_email("m1"), _email("m2")], [_email("m3")]])
+    job = scan(mailbox)
+    assert mailbox.calls == ["800"]
+    assert job.status == ScanStatus.COMPLETED and (job.fetched, job.classified, job.persisted) == (3, 3, 3)
+    assert sorted(company for (company,) in db.query(JobApplication.company_name)) == ["M1", "M2", "M3"]
+    assert user.gmail_history_id == "950"
+
+def test_failed_or_lost_messages_keep_the_cursor(scan, db, user):
+    job = scan(_Mailbox([[_email("m1"), _email("m2")]]), failing={"m2"})
+    # What did classify is kept, but the next scan starts from the same place to retry m2
+    assert job.status == ScanStatus.COMPLETED
+    assert [company for (company,) in db.query(JobApplication.company_name)] == ["M1"]
+    assert user.gmail_history_id == "800"
+
+    job = scan(_Mailbox([[_email("m3")]], lost=1))
+    assert job.status == ScanStatus.COMPLETED and user.gmail_history_id == "800"
+
+def test_cancelled_scans_stop_before_the_next_chunk_and_keep_the_cursor(scan, db, user):
+    mailbox = _Mailbox([[_email("m1")], [_email("m2")]])
+
+    def cancel_after_the_first_batch(i):
+        if i == 1:
+            cancel_db = scan_service.SessionLocal()
+            cancel_db.query(ScanJob).update({"cancel_requested": True})
+            cancel_db.commit()
+            cancel_db.close()
+
+    mailbox.on_batch = cancel_after_the_first_batch
+    job = scan(mailbox)
+    assert job.status == ScanStatus.CANCELLED and job.finished_at
+    assert "M2" not in {company for (company,) in db.query(JobApplication.company_name)}
+    assert user.gmail_history_id == "800"
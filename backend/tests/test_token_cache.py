@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from backend.models import AuthTokenCache
+from backend.token_cache import cache_token, get_cached_user, hash_token
+
+def _profile_calls(gmail):
+    return sum(1 for path, _ in gmail.requests if path == "profile")
+
+def test_entries_expire_after_the_ttl(db, user):
+    cache_token(db, "good", user.id)
+    assert get_cached_user(db, "good").id == user.id
+    assert get_cached_user(db, "other") is None
+
+    entry = db.query(AuthTokenCache).filter(AuthTokenCache.token_hash == hash_token("good")).one()
+    entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert get_cached_user(db, "good") is None
+    # Expired entries are swept on the next write
+    cache_token(db, "another", user.id)
+    assert [row.token_hash for row in db.query(AuthTokenCache)] == [hash_token("another")]
+
+def test_cached_tokens_skip_google_until_it_rejects_them(client, db, user, gmail):
+    # Not signed in: tokens are checked against the fake Gmail server
+    headers = {"Authorization": "Bearer good"}
+    assert client.get("/users/me", headers=headers).json()["email"] == "me@example.com"
+    assert _profile_calls(gmail) == 1
+    # Verified once, then served from the cache
+    assert client.get("/users/me", headers=headers).status_code == 200
+    assert _profile_calls(gmail) == 1
+
+    assert client.get("/users/me", headers={"Authorization": "Bearer bad"}).status_code == 401
+    assert db.query(AuthTokenCache).filter(AuthTokenCache.token_hash == hash_token("bad")).count() == 0
+
+    # A token cached earlier that Google now rejects (401 on the scan's own check) is dropped
+    cache_token(db, "bad", user.id)
+    assert client.get("/users/me", headers={"Authorization": "Bearer bad"}).status_code == 200
+    assert client.post("/scan/", headers={"token": "bad"}).status_code == 401
+    assert client.get("/users/me", headers={"Authorization": "Bearer bad"}).status_code == 401
@@ -0,0 +1,44 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import AuthTokenCache, User
+
+# Verified access tokens are remembered for a short while so authenticated
+# requests don't each need a round-trip to Google. Stored in the DB so every
+# gunicorn worker shares the same entries.
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+
+def hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def get_cached_user(db: Session, token):
+    """Return the User for a recently verified token, or None."""
+    entry = db.query(AuthTokenCache).filter(
+        AuthTokenCache.token_hash == hash_token(token),
+        AuthTokenCache.expires_at > datetime.utcnow()
+    ).first()
+    if not entry:
+        return None
+    return db.query(User).filter(User.id == entry.user_id).first()
+
+def cache_token(db: Session, token, user_id):
+    now = datetime.utcnow()
+    # Clear out expired entries while we're here
+    db.query(AuthTokenCache).filter(AuthTokenCache.expires_at <= now).delete(synchronize_session=False)
+    db.merge(AuthTokenCache(
+        token_hash=hash_token(token),
+        user_id=user_id,
+        expires_at=now + timedelta(seconds=AUTH_CACHE_TTL_SECONDS)
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker cached the same token at the same time
+        db.rollback()
+
+def invalidate_token(db: Session, token):
+    """Forget a token, e.g. after Google rejected it with a 401."""
+    db.query(AuthTokenCache).filter(AuthTokenCache.token_hash == hash_token(token)).delete(synchronize_session=False)
+    db.commit()
@@ -15,6 +15,7 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+// Starts a background scan; poll getScanStatus with the returned scan_id
 export const scanEmails = async (token: string) => {
     return api.post('/scan/', {}, {
         headers: {
@@ -24,6 +25,14 @@ export const scanEmails = async (token: string) => {
     });
 };
 
+export const getScanStatus = async (scanId: string) => {
+    return api.get(`/scan/${scanId}`);
+};
+
+export const cancelScan = async (scanId: string) => {
+    return api.post(`/scan/${scanId}/cancel`);
+};
+
 export const createJob = async (jobData: any) => {
     return api.post('/jobs/', jobData);
 };
@@ -43,6 +52,10 @@ export const updateJobStatus = async (id: number, status: string) => {
 
 export const deleteJob = (id: number) => api.delete(`/jobs/${id}`);
 
+// Creates, partial updates and deletes in one request and one transaction
+export const batchJobs = (batch: { create?: any[]; update?: any[]; delete?: number[] }) =>
+    api.post('/jobs/batch', batch);
+
 export const getAnalytics = () => api.get('/analytics/stats');
 
 export const exportJobsCsv = () => api.get('/analytics/export', { responseType: 'blob' });
@@ -58,12 +58,12 @@ export const ProfileModal: React.FC<ProfileModalProps> = ({ token, onClose }) =>
                     <div>
                         <label style={{ display: 'block', marginBottom: '0.5rem', color: 'var(--text-secondary)' }}>Ignored Senders (Emails)</label>
                         <p style={{ fontSize: '0.8rem', color: 'var(--text-secondary)', marginTop: 0 }}>
-                            Emails from these senders will be skipped during scanning. Separate with commas.
+                            Emails from these senders will be skipped during scanning. Use a full address or a domain (e.g. company.com), separated with commas.
                         </p>
                         <textarea
                             value={ignoredEmails}
                             onChange={e => setIgnoredEmails(e.target.value)}
-                            placeholder="recruiter@spam.com, newsletter@company.com"
+                            placeholder="recruiter@spam.com, newsletters.company.com"
                             rows={5}
                             style={{ width: '100%', padding: '0.5rem', borderRadius: '6px', border: '1px solid var(--bg-tertiary)', background: 'var(--bg-primary)', color: 'var(--text-primary)' }}
                         />
@@ -2,7 +2,7 @@ import { useState, useEffect } from 'react'
 import '../App.css'
 import { arrayMove } from '@dnd-kit/sortable';
 import { type DragOverEvent, type DragStartEvent } from '@dnd-kit/core';
-import { scanEmails, verifyToken, getJobs, createJob, updateJob, deleteJob } from '../api';
+import { scanEmails, getScanStatus, cancelScan, verifyToken, getJobs, createJob, updateJob, deleteJob } from '../api';
 import { Board } from '../components/Board';
 import { ProfileModal } from '../components/ProfileModal';
 import { JobModal } from '../components/JobModal';
@@ -10,6 +10,9 @@ import { AnalyticsView } from '../components/AnalyticsView';
 import { useToast } from '../contexts/ToastContext';
 import { CustomSelect } from '../components/CustomSelect';
 
+// Stop polling a scan after this long, in case it never reports an end state
+const SCAN_POLL_TIMEOUT_MS = 15 * 60 * 1000;
+
 function Home() {
   const [token, setToken] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
@@ -97,10 +100,27 @@ function Home() {
     setScanResult(null); // Clear previous results
     try {
       const response = await scanEmails(token);
-      if (response.data.processed > 0) {
-        showToast(`Scanned ${response.data.processed} emails!`, 'success');
-      } else {
+
+      // The scan runs in the background; poll until it finishes or the timeout passes
+      let scan = response.data;
+      const deadline = Date.now() + SCAN_POLL_TIMEOUT_MS;
+      while (scan.status === 'PENDING' || scan.status === 'RUNNING') {
+        if (Date.now() > deadline) {
+          cancelScan(scan.scan_id).catch(e => console.error("Failed to cancel scan", e));
+          break;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        scan = (await getScanStatus(scan.scan_id)).data;
+      }
+
+      if (scan.status === 'PENDING' || scan.status === 'RUNNING') {
+        showToast('Scan is taking too long and was cancelled. Please try again.', 'error');
+      } else if (scan.status === 'COMPLETED' && scan.persisted > 0) {
+        showToast(`Found ${scan.persisted} job emails!`, 'success');
+      } else if (scan.status === 'COMPLETED') {
         showToast('No new relevant emails found.', 'info');
+      } else {
+        showToast(scan.message || 'Scan did not complete.', 'error');
       }
       loadJobs(); // Reload jobs after scan
     } catch (error: any) {